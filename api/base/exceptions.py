@@ -5,3 +5,38 @@ from rest_framework.exceptions import APIException
 class NotAValidStepType(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = 'Given step type is not a valid step type'
+
+
+class CircularReference(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Linking this step would create a circular reference'
+
+
+class StepsNotFound(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'One or more of the given steps do not exist'
+
+
+class NotAValidOrder(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Given order does not match the linked steps'
+
+
+class NothingToPublish(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Sequence has no linked steps to publish'
+
+
+class UploadsNotSupported(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Direct uploads require an S3 media storage'
+
+
+class UploadNotFound(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'The uploaded file could not be found in storage'
+
+
+class NotAValidUpload(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'The uploaded file does not match the upload'
@@ -1,13 +1,26 @@
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.settings import api_settings
 
+from api.functions.search import search
 
-class SequenceSearchFilter(SearchFilter):
-    # TODO: remove this workaround
-    def get_search_fields(self, view, request):
-        fields = super().get_search_fields(view, request)
 
-        if 'title' in fields:
-            return ['step__title']
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Searches the view's search_vector, and its search_trigram_fields for
+    similar words, ranking the results. Unlike SearchFilter it is answered
+    from indexes.
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+
+        return search(queryset,
+                      term,
+                      getattr(view, 'search_vector', 'search'),
+                      getattr(view, 'search_trigram_fields', []))
 
 
 class SequenceOrderingFilter(OrderingFilter):
@@ -1,10 +1,14 @@
 import pytest
 
+from botocore.stub import Stubber
+from django.core.cache import cache
 from rest_framework.test import APIClient
 
+from api.models.content import Image
 from api.models.step import Step, LinkedStep
 from api.models.sequence import Sequence
 from api.base.choices import StepChoices
+from sequenceapi import storages
 
 
 @pytest.fixture
@@ -37,11 +41,44 @@ def make_linked_steps(make_step):
         super.save()
 
         linked_steps = []
-        for pos in range(sub):
+        for _ in range(sub):
             sub = make_step()
-            linked_step = LinkedStep.objects.create(super=super,
-                                                    sub=sub,
-                                                    pos=pos)
+            linked_step = LinkedStep.objects.create(super=super, sub=sub)
             linked_steps.append(linked_step)
         return linked_steps
     return _linked_steps
+
+
+@pytest.fixture
+def media_storage(settings, tmp_path):
+    settings.DEFAULT_FILE_STORAGE = \
+        'django.core.files.storage.FileSystemStorage'
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.MEDIA_URL = '/media/'
+    cache.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def make_image(media_storage):
+    def _image(name='image.png'):
+        return Image.objects.create(image=name, title=name)
+    return _image
+
+
+@pytest.fixture
+def s3(settings, monkeypatch):
+    """
+    Stubs the shared S3 client, which is created with fake credentials so
+    that requests can be presigned.
+    """
+    settings.AWS_S3_ACCESS_KEY_ID = 'testing'
+    settings.AWS_S3_SECRET_ACCESS_KEY = 'testing'
+    settings.STORAGE_DELETE_BATCH_WAIT = 0.01
+    settings.STORAGE_DELETE_BACKOFF = 0
+    monkeypatch.setattr(storages, '_session', None)
+    monkeypatch.setattr(storages, '_client', None)
+    monkeypatch.setattr(storages, '_resource_class', None)
+    with Stubber(storages.s3_client()) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
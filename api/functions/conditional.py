@@ -0,0 +1,39 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from api.models.step import Step
+
+
+def tree_condition(get):
+    """
+    Decorates the GET handler of a view rendering the tree below the step
+    with the given uuid. Conditional requests are answered with a 304 after
+    a single validator query, full responses carry ETag and Last-Modified.
+    """
+    @wraps(get)
+    def wrapper(view, request, uuid, *args, **kwargs):
+        updated, count = Step.tree_validators(uuid)
+        if updated is None:
+            return get(view, request, uuid, *args, **kwargs)
+
+        # Representations differ per url, query parameters and media type
+        validator = '|'.join([str(updated.timestamp()),
+                              str(count),
+                              request.build_absolute_uri(),
+                              request.accepted_media_type])
+        etag = f'"{hashlib.sha256(validator.encode()).hexdigest()}"'
+        last_modified = int(updated.timestamp())
+
+        response = get_conditional_response(request,
+                                            etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = get(view, request, uuid, *args, **kwargs)
+        if response.status_code in [200, 304]:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+    return wrapper
@@ -0,0 +1,23 @@
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from api.functions.custom_renderers import MessagePackRenderer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class MessagePackParser(parsers.BaseParser):
+    """
+    Parses MessagePack request bodies. Needs the optional msgpack package.
+    """
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
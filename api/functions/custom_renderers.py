@@ -1,4 +1,60 @@
+import orjson
 from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Turns the values neither format supports natively into what the stdlib
+# JSON renderer would write for them, e.g. uuids and datetimes to strings
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    Renders JSON with orjson, byte for byte like JSONRenderer. Indented
+    output and data orjson can not encode, like integers past 64 bits, are
+    left to JSONRenderer.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            content = orjson.dumps(data, default=encode_default,
+                                   option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        # Escaped like JSONRenderer, to keep the output valid javascript
+        return content.replace('\u2028'.encode(), b'\\u2028') \
+                      .replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Renders MessagePack, with uuids, datetimes and the like written as the
+    same strings as in JSON. Needs the optional msgpack package.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default,
+                             use_bin_type=True, datetime=False)
 
 
 class JPEGRenderer(renderers.BaseRenderer):
@@ -19,3 +75,13 @@ class PNGRenderer(renderers.BaseRenderer):
 
     def render(self, data, media_type=None, renderer_context=None):
         return data
+
+
+class WebPRenderer(renderers.BaseRenderer):
+    media_type = 'image/webp'
+    format = 'webp'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return data
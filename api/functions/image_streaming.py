@@ -0,0 +1,98 @@
+import re
+from calendar import timegm
+
+from django.core.cache import cache
+from django.conf import settings
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from sequenceapi.storages import storage_key
+
+
+CHUNK_SIZE = 64 * 1024
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class StoredFile:
+    """
+    Size, validators and byte ranges of a file in storage, read without
+    downloading the whole file first.
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        if isinstance(storage, S3Boto3Storage):
+            # A single HEAD request, the body is only fetched per range
+            self.object = storage.bucket.Object(storage_key(storage, name))
+            self.size = self.object.content_length
+            self.modified = self.object.last_modified
+            self.etag = self.object.e_tag
+        else:
+            self.object = None
+            self.size = storage.size(name)
+            self.modified = storage.get_modified_time(name)
+            mtime = int(self.modified.timestamp() * 1000000)
+            self.etag = f'"{self.size:x}-{mtime:x}"'
+
+    @property
+    def last_modified(self):
+        return timegm(self.modified.utctimetuple())
+
+    def chunks(self, start, end):
+        """
+        Yields the bytes from start up to and including end.
+        """
+        if self.object is not None:
+            body = self.object.get(Range=f'bytes={start}-{end}')['Body']
+            yield from body.iter_chunks(CHUNK_SIZE)
+            return
+
+        remaining = end - start + 1
+        with self.storage.open(self.name, 'rb') as file:
+            file.seek(start)
+            while remaining > 0:
+                chunk = file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) for a single byte range header and None when the
+    whole file should be sent. Raises ValueError for ranges outside of the
+    file.
+    """
+    match = RANGE.match(header or '')
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def storage_url(storage, name):
+    """
+    Returns the url of a stored file, from IMAGE_CDN_URL when configured or
+    signed by the storage and cached for less than it is valid.
+    """
+    if settings.IMAGE_CDN_URL:
+        return f'{settings.IMAGE_CDN_URL}/{name}'
+
+    key = f'storage-url:{name}'
+    url = cache.get(key)
+    if url is None:
+        url = storage.url(name)
+        cache.set(key, url, timeout=settings.IMAGE_URL_CACHE_TIMEOUT)
+    return url
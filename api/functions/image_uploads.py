@@ -0,0 +1,149 @@
+import math
+import os
+import uuid
+from datetime import timedelta
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from api.base.exceptions import (
+    NotAValidUpload,
+    UploadNotFound,
+    UploadsNotSupported)
+from api.functions.storage_deletion import delete_files
+from sequenceapi.storages import s3_client, storage_key
+
+
+TOKEN_SALT = 'api.image-upload'
+
+
+def start_upload(storage, filename, content_type, size):
+    """
+    Returns where and how a client uploads an image of size bytes directly
+    to the bucket, under a new uuid. Files above IMAGE_UPLOAD_PART_SIZE are
+    uploaded in parts, each to its own presigned url. The returned token
+    is needed to finalize the upload.
+    """
+    if not isinstance(storage, S3Boto3Storage):
+        raise UploadsNotSupported()
+
+    image_uuid = uuid.uuid4()
+    extension = os.path.splitext(filename)[1].lower()
+    name = f'{image_uuid}{extension}'
+    key = storage_key(storage, name)
+    client = s3_client()
+    expires = settings.IMAGE_UPLOAD_EXPIRE
+
+    upload = {'uuid': image_uuid, 'name': name, 'expires': expires}
+    if size <= settings.IMAGE_UPLOAD_PART_SIZE:
+        post = client.generate_presigned_post(
+            Bucket=storage.bucket_name,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type},
+                        ['content-length-range', 1, size]],
+            ExpiresIn=expires)
+        upload.update(method='POST', url=post['url'], fields=post['fields'],
+                      token=upload_token(image_uuid, name))
+        return upload
+
+    upload_id = client.create_multipart_upload(
+        Bucket=storage.bucket_name,
+        Key=key,
+        ContentType=content_type)['UploadId']
+    count = math.ceil(size / settings.IMAGE_UPLOAD_PART_SIZE)
+    parts = [{'part_number': number,
+              'url': client.generate_presigned_url(
+                  'upload_part',
+                  Params={'Bucket': storage.bucket_name,
+                          'Key': key,
+                          'UploadId': upload_id,
+                          'PartNumber': number},
+                  ExpiresIn=expires)}
+             for number in range(1, count + 1)]
+    upload.update(method='PUT', upload_id=upload_id, parts=parts,
+                  token=upload_token(image_uuid, name, upload_id))
+    return upload
+
+
+def upload_token(image_uuid, name, upload_id=None):
+    """
+    Signs the object a started upload may be finalized with, so that
+    finalizing can not claim any other object in the bucket.
+    """
+    return signing.dumps({'uuid': str(image_uuid),
+                          'name': name,
+                          'upload_id': upload_id},
+                         salt=TOKEN_SALT)
+
+
+def read_upload_token(token):
+    """
+    Returns the upload signed into token, or None when the token is not
+    valid or older than IMAGE_UPLOAD_FINALIZE_EXPIRE.
+    """
+    try:
+        return signing.loads(token,
+                             salt=TOKEN_SALT,
+                             max_age=settings.IMAGE_UPLOAD_FINALIZE_EXPIRE)
+    except signing.BadSignature:
+        return None
+
+
+def finish_upload(storage, name, upload_id=None, parts=None):
+    """
+    Completes a multipart upload and checks that the uploaded object is an
+    image within the size limit. Returns the object's metadata.
+    """
+    if not isinstance(storage, S3Boto3Storage):
+        raise UploadsNotSupported()
+
+    key = storage_key(storage, name)
+    client = s3_client()
+    try:
+        if upload_id:
+            client.complete_multipart_upload(
+                Bucket=storage.bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': part['part_number'],
+                     'ETag': part['etag']}
+                    for part in parts]})
+        head = client.head_object(Bucket=storage.bucket_name, Key=key)
+    except ClientError as error:
+        raise UploadNotFound() from error
+
+    if not head.get('ContentType', '').startswith('image/') or \
+            head['ContentLength'] > settings.IMAGE_UPLOAD_MAX_SIZE:
+        delete_files(storage, [name])
+        raise NotAValidUpload()
+    return head
+
+
+def abort_abandoned_uploads(storage):
+    """
+    Aborts the multipart uploads to storage that were started longer than
+    IMAGE_UPLOAD_FINALIZE_EXPIRE ago, whose parts would otherwise be kept
+    and billed forever. Returns the number of aborted uploads.
+    """
+    if not isinstance(storage, S3Boto3Storage):
+        raise UploadsNotSupported()
+
+    client = s3_client()
+    before = timezone.now() - timedelta(
+        seconds=settings.IMAGE_UPLOAD_FINALIZE_EXPIRE)
+    paginator = client.get_paginator('list_multipart_uploads')
+    aborted = 0
+    for page in paginator.paginate(Bucket=storage.bucket_name,
+                                   Prefix=f'{storage.location}/'):
+        for upload in page.get('Uploads', []):
+            if upload['Initiated'] < before:
+                client.abort_multipart_upload(Bucket=storage.bucket_name,
+                                              Key=upload['Key'],
+                                              UploadId=upload['UploadId'])
+                aborted += 1
+    return aborted
@@ -0,0 +1,105 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image as PILImage, ImageOps
+
+from api.models.content import Image, ImageBlob
+
+
+FORMATS = {'JPEG': 'jpeg', 'PNG': 'png', 'WEBP': 'webp'}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def schedule_variants(image):
+    """
+    Generates the variants of image on a background thread once the
+    current transaction commits, so uploads do not wait for resizing.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants')
+
+    pk = image.pk
+    transaction.on_commit(lambda: _executor.submit(_generate_variants, pk))
+
+
+def _generate_variants(pk):
+    # Nothing waits for the result, failures would otherwise go unnoticed
+    try:
+        generate_variants(Image.objects.get(pk=pk))
+    except Exception:
+        logger.exception('Generating the variants of image %s failed', pk)
+    finally:
+        close_old_connections()
+
+
+def generate_variants(image):
+    """
+    Stores resized copies of image next to the original, in the original
+    format and as WebP, for every configured width below the original
+    width, and records them on the image, its blob and the blob's images.
+    """
+    with image.image.open('rb') as file:
+        original = PILImage.open(file)
+        original.load()
+    format = original.format
+    original = ImageOps.exif_transpose(original)
+    width, height = original.size
+
+    variants = [{'name': image.image.name,
+                 'width': width,
+                 'height': height,
+                 'format': FORMATS.get(format, format.lower())}]
+    stem = os.path.splitext(image.image.name)[0]
+
+    for label, variant_width in settings.IMAGE_VARIANT_WIDTHS.items():
+        if variant_width < width:
+            size = (variant_width, max(round(height * variant_width / width),
+                                       1))
+            resized = original.resize(size, PILImage.Resampling.LANCZOS)
+            variants.append(_store(resized, f'{stem}-{label}', format))
+            variants.append(_store(resized, f'{stem}-{label}', 'WEBP'))
+    variants.append(_store(original, stem, 'WEBP'))
+
+    with transaction.atomic():
+        images = Image.objects.filter(pk=image.pk)
+        if image.blob_id is not None:
+            # Uploads take their reference on the blob and copy its variants
+            # in one transaction. Updating the blob first waits for those
+            # still running, so the images update below includes their
+            # images, and uploads after it copy the variants from the blob.
+            ImageBlob.objects.filter(pk=image.blob_id) \
+                .update(variants=variants)
+            images = Image.objects.filter(blob_id=image.blob_id)
+        images.update(variants=variants)
+    image.variants = variants
+    return variants
+
+
+def _store(image, stem, format):
+    if format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = BytesIO()
+    image.save(buffer, format=format, quality=85)
+    extension = FORMATS.get(format, format.lower())
+    name = image_storage().save(f'{stem}.{extension}',
+                                ContentFile(buffer.getvalue()))
+    return {'name': name,
+            'width': image.width,
+            'height': image.height,
+            'format': extension}
+
+
+def image_storage():
+    return Image._meta.get_field('image').storage
@@ -0,0 +1,27 @@
+import re
+import uuid
+
+from api.models.content import Image
+
+
+IMAGE_PLACEHOLDER = re.compile(r'\[\[img\|([0-9a-f-]{36})\]\]')
+
+
+def expand_image_placeholders(content):
+    """
+    Replaces [[img|<uuid>]] placeholders in content by image urls in a
+    single pass. Unknown images are left as they are.
+    """
+    uuids = set()
+    for match in IMAGE_PLACEHOLDER.finditer(content):
+        try:
+            uuids.add(uuid.UUID(match.group(1)))
+        except ValueError:
+            pass
+    if not uuids:
+        return content
+
+    urls = {str(pk): url for pk, url in Image.urls(uuids).items()}
+    return IMAGE_PLACEHOLDER.sub(
+        lambda match: urls.get(match.group(1), match.group(0)),
+        content)
@@ -0,0 +1,106 @@
+"""
+Ranks are fractional ordering keys: strings of base 36 digits read as the
+digits after the decimal point. They sort lexicographically, which requires
+the "C" collation in the database, and there is always room for another
+rank between two ranks. Ranks never end in "0", so there also always is a
+rank before any other rank.
+"""
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def rank_between(before, after):
+    """
+    Returns a rank sorting between before and after, either of which can be
+    None for the start or end of the list.
+    """
+    if after is None:
+        return _rank_after(before or '')
+    if before is None:
+        return _rank_before(after)
+    if before >= after:
+        raise ValueError(f'{before!r} does not sort before {after!r}')
+    return _midpoint(before, after)
+
+
+def ranks_between(before, after, count):
+    """
+    Returns count ascending ranks between before and after, keeping them as
+    short as possible.
+    """
+    if count == 0:
+        return []
+
+    if after is None:
+        ranks = [rank_between(before, None)]
+        while len(ranks) < count:
+            ranks.append(rank_between(ranks[-1], None))
+        return ranks
+
+    if before is None:
+        ranks = [rank_between(None, after)]
+        while len(ranks) < count:
+            ranks.insert(0, rank_between(None, ranks[0]))
+        return ranks
+
+    rank = rank_between(before, after)
+    half = count // 2
+    return ranks_between(before, rank, half) + [rank] + \
+        ranks_between(rank, after, count - half - 1)
+
+
+def balanced_ranks(count):
+    """
+    Returns count evenly spaced ascending ranks of the smallest length.
+    """
+    length = 1
+    while BASE ** length <= count:
+        length += 1
+    spacing = BASE ** length // (count + 1)
+
+    ranks = []
+    for i in range(1, count + 1):
+        value = i * spacing
+        digits = []
+        for _ in range(length):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append(''.join(reversed(digits)).rstrip(DIGITS[0]))
+    return ranks
+
+
+def _rank_after(rank):
+    # Incrementing the first digit that can be incremented keeps repeatedly
+    # appended ranks short
+    for i, digit in enumerate(rank):
+        if digit != DIGITS[-1]:
+            return rank[:i] + DIGITS[DIGITS.index(digit) + 1]
+    return rank + DIGITS[BASE // 2]
+
+
+def _rank_before(rank):
+    # Mirrors _rank_after, the last digit of a rank must not become a "0"
+    for i, digit in enumerate(rank):
+        digit = DIGITS.index(digit)
+        if digit > 1:
+            return rank[:i] + DIGITS[digit - 1]
+        if digit == 1:
+            return rank[:i] + DIGITS[0] + DIGITS[-1]
+
+
+def _midpoint(before, after):
+    # after is None stands for the end of the list
+    if after is not None:
+        n = 0
+        while n < len(after) and (before[n:n + 1] or DIGITS[0]) == after[n]:
+            n += 1
+        if n > 0:
+            return after[:n] + _midpoint(before[n:], after[n:])
+
+    digit_before = DIGITS.index(before[0]) if before else 0
+    digit_after = DIGITS.index(after[0]) if after is not None else BASE
+    if digit_after - digit_before > 1:
+        return DIGITS[(digit_before + digit_after + 1) // 2]
+    if after is not None and len(after) > 1:
+        return after[0]
+    return DIGITS[digit_before] + _midpoint(before[1:], None)
@@ -0,0 +1,62 @@
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity)
+from django.db import connection
+from django.db.models import F, Q
+
+
+# Must match the configuration of the search triggers, see migration 0016
+CONFIG = 'simple'
+WORD = re.compile(r'\w+')
+
+_trigram = {}
+
+
+def search_query(term):
+    """
+    Returns a query matching documents with words starting with every word
+    of term, or None when term has no words.
+    """
+    words = WORD.findall(term.lower())
+    if not words:
+        return None
+    # Words can not contain tsquery syntax, so they need no quoting
+    raw = ' & '.join(f'{word}:*' for word in words)
+    return SearchQuery(raw, search_type='raw', config=CONFIG)
+
+
+def trigram_available():
+    # pg_trgm is optional, the search migration only installs it where the
+    # server provides it
+    alias = connection.alias
+    if alias not in _trigram:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram[alias] = cursor.fetchone() is not None
+    return _trigram[alias]
+
+
+def search(queryset, term, vector='search', trigram_fields=()):
+    """
+    Filters queryset down to the rows matching term in the search vector,
+    or with a similar word in one of the trigram fields, ordered by rank.
+    The rank is annotated as search_rank.
+    """
+    query = search_query(term)
+    if query is None:
+        return queryset.none()
+
+    condition = Q(**{vector: query})
+    rank = SearchRank(F(vector), query)
+    if trigram_fields and trigram_available():
+        for field in trigram_fields:
+            condition |= Q(**{f'{field}__trigram_word_similar': term})
+            rank = rank + TrigramWordSimilarity(term, field)
+
+    return queryset.filter(condition) \
+                   .annotate(search_rank=rank) \
+                   .order_by('-search_rank', '-pk')
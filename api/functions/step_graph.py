@@ -0,0 +1,148 @@
+import fcntl
+import mmap
+import os
+import struct
+import uuid
+from array import array
+from bisect import bisect_left
+
+
+HEADER = struct.Struct('=4sI16sII')
+MAGIC = b'SQGR'
+FORMAT = 1
+
+
+class StepGraph:
+    """
+    Read-only copy of the step graph in compressed sparse row layout. Step
+    ids are stored once in a sorted array, edges as offsets into children
+    and parents arrays, ordered by position. The arrays live in a memory
+    mapped file, so all workers on a node share a single copy.
+    """
+    _loaded = {}
+
+    def __init__(self, buffer):
+        magic, format, version, nodes, edges = HEADER.unpack_from(buffer)
+        if magic != MAGIC or format != FORMAT:
+            raise ValueError('Not a step graph file')
+        if len(buffer) != HEADER.size + 4 * (3 * nodes + 2 * edges + 2):
+            raise ValueError('Truncated step graph file')
+
+        ints = memoryview(buffer)[HEADER.size:].cast('i')
+        self.version = uuid.UUID(bytes=version)
+        self.ids = ints[:nodes]
+        ints = ints[nodes:]
+        self.offsets = ints[:nodes + 1]
+        ints = ints[nodes + 1:]
+        self.sub_indexes = ints[:edges]
+        ints = ints[edges:]
+        self.parent_offsets = ints[:nodes + 1]
+        self.super_indexes = ints[nodes + 1:nodes + 1 + edges]
+
+    @classmethod
+    def load(cls, path, version, edges):
+        """
+        Returns the graph stored at path, rebuilding it from the edges
+        callable when it does not match the given version.
+        """
+        graph = cls._loaded.get(path)
+        if graph is not None and graph.version == version:
+            return graph
+
+        graph = cls.open(path)
+        if graph is None or graph.version != version:
+            with open(f'{path}.lock', 'w') as lock:
+                # Only one worker rebuilds, the others map its result
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                graph = cls.open(path)
+                if graph is None or graph.version != version:
+                    cls.write(path, version, edges())
+                    graph = cls.open(path)
+
+        cls._loaded[path] = graph
+        return graph
+
+    @classmethod
+    def open(cls, path):
+        try:
+            with open(path, 'rb') as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        try:
+            return cls(buffer)
+        except (ValueError, struct.error):
+            return None
+
+    @classmethod
+    def write(cls, path, version, edges):
+        """
+        Writes edges, (super_id, sub_id) pairs ordered by super step and
+        position, to path. The file is replaced atomically so that workers
+        still reading the previous graph keep a consistent view.
+        """
+        edges = list(edges)
+        ids = array('i', sorted({pk for edge in edges for pk in edge}))
+        index = {pk: i for i, pk in enumerate(ids)}
+
+        supers = array('i', (index[super] for super, _ in edges))
+        subs = array('i', (index[sub] for _, sub in edges))
+        by_sub = sorted(range(len(edges)), key=subs.__getitem__)
+
+        offsets = cls._offsets(supers, len(ids))
+        parent_offsets = cls._offsets(subs, len(ids))
+        super_indexes = array('i', (supers[i] for i in by_sub))
+
+        header = HEADER.pack(MAGIC, FORMAT, version.bytes, len(ids),
+                             len(edges))
+        temp_path = f'{path}.{os.getpid()}'
+        with open(temp_path, 'wb') as file:
+            file.write(header)
+            for values in [ids, offsets, subs, parent_offsets, super_indexes]:
+                values.tofile(file)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _offsets(indexes, length):
+        offsets = array('i', [0]) * (length + 1)
+        for i in indexes:
+            offsets[i + 1] += 1
+        for i in range(length):
+            offsets[i + 1] += offsets[i]
+        return offsets
+
+    def index(self, pk):
+        i = bisect_left(self.ids, pk)
+        if i < len(self.ids) and self.ids[i] == pk:
+            return i
+        return None
+
+    def children(self, pk):
+        i = self.index(pk)
+        if i is None:
+            return []
+        indexes = self.sub_indexes[self.offsets[i]:self.offsets[i + 1]]
+        return [self.ids[j] for j in indexes]
+
+    def parents(self, pk):
+        i = self.index(pk)
+        if i is None:
+            return []
+        start, end = self.parent_offsets[i], self.parent_offsets[i + 1]
+        return [self.ids[j] for j in self.super_indexes[start:end]]
+
+    def subtree(self, pk):
+        """
+        Returns the children of pk and of every step below it, keyed by
+        step id.
+        """
+        children = {}
+        pending = [pk]
+        while pending:
+            super = pending.pop()
+            if super in children:
+                continue
+            children[super] = self.children(super)
+            pending.extend(children[super])
+        return children
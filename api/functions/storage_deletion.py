@@ -0,0 +1,121 @@
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from sequenceapi.storages import s3_client, storage_key
+
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 1000
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_worker = None
+
+
+def delete_files(storage, names):
+    """
+    Deletes the stored files once the current transaction commits. Files in
+    S3 are queued and removed in batches by a background thread, other
+    storages delete them right away.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    if not isinstance(storage, S3Boto3Storage):
+        transaction.on_commit(lambda: [storage.delete(name)
+                                       for name in names])
+        return
+
+    bucket = storage.bucket_name
+    keys = [storage_key(storage, name) for name in names]
+    transaction.on_commit(lambda: _enqueue(bucket, keys))
+
+
+def _enqueue(bucket, keys):
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_work,
+                                       name='storage-deletion',
+                                       daemon=True)
+            _worker.start()
+    for key in keys:
+        _queue.put((bucket, key))
+
+
+def flush():
+    """
+    Blocks until all queued deletions have been sent.
+    """
+    _queue.join()
+
+
+def _work():
+    while True:
+        batch = [_queue.get()]
+        # Keys deleted together usually arrive together, wait briefly to
+        # send them in one request
+        deadline = time.monotonic() + settings.STORAGE_DELETE_BATCH_WAIT
+        while len(batch) < settings.STORAGE_DELETE_BATCH_SIZE:
+            try:
+                timeout = max(deadline - time.monotonic(), 0)
+                batch.append(_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        try:
+            buckets = {}
+            for bucket, key in batch:
+                buckets.setdefault(bucket, []).append(key)
+            for bucket, keys in buckets.items():
+                delete_objects(bucket, keys)
+        except Exception:
+            logger.exception('Deleting %d stored files failed', len(batch))
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def delete_objects(bucket, keys, retries=None):
+    """
+    Deletes keys from bucket with as few requests as possible, retrying
+    failed keys with exponential backoff. Returns the keys that could not
+    be deleted.
+    """
+    if retries is None:
+        retries = settings.STORAGE_DELETE_RETRIES
+
+    client = s3_client()
+    failed = []
+    for i in range(0, len(keys), MAX_BATCH_SIZE):
+        pending = keys[i:i + MAX_BATCH_SIZE]
+        for attempt in range(retries + 1):
+            if attempt:
+                backoff = settings.STORAGE_DELETE_BACKOFF
+                time.sleep(backoff * 2 ** (attempt - 1))
+            try:
+                response = client.delete_objects(
+                    Bucket=bucket,
+                    Delete={'Objects': [{'Key': key} for key in pending],
+                            'Quiet': True})
+            except Exception:
+                logger.warning('Deleting %d objects from %s failed',
+                               len(pending), bucket, exc_info=True)
+                continue
+
+            pending = [error['Key'] for error in response.get('Errors', [])]
+            if not pending:
+                break
+
+        if pending:
+            logger.error('Gave up deleting %s from %s', pending, bucket)
+            failed.extend(pending)
+    return failed
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.base.exceptions import UploadsNotSupported
+from api.functions.image_uploads import abort_abandoned_uploads
+from api.functions.image_variants import image_storage
+
+
+class Command(BaseCommand):
+    help = 'Aborts multipart image uploads that were never finalized'
+
+    def handle(self, *args, **options):
+        try:
+            aborted = abort_abandoned_uploads(image_storage())
+        except UploadsNotSupported:
+            raise CommandError('Images are not stored in S3')
+        self.stdout.write(f'Aborted {aborted} abandoned uploads')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import APIException
+
+from api.models.sequence import Sequence
+
+
+class Command(BaseCommand):
+    help = 'Publishes sequences, so that they can be followed as guides'
+
+    def add_arguments(self, parser):
+        parser.add_argument('uuids', nargs='+', help='Sequence uuids')
+
+    def handle(self, *args, **options):
+        for uuid in options['uuids']:
+            try:
+                sequence = Sequence.objects.select_related('step') \
+                                           .get(step__uuid=uuid)
+                published_sequence = sequence.publish()
+            except Sequence.DoesNotExist:
+                raise CommandError(f'Sequence {uuid} does not exist')
+            except APIException as e:
+                raise CommandError(f'Sequence {uuid}: {e.detail}')
+
+            self.stdout.write(f'Published sequence {uuid} as '
+                              f'{published_sequence.uuid}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Length
+
+from api.models.step import LinkedStep
+
+
+class Command(BaseCommand):
+    help = 'Rebalances the ranks of linked steps that grew too long'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length',
+                            type=int,
+                            default=8,
+                            help='Rebalance super steps with longer ranks')
+
+    def handle(self, *args, **options):
+        super_ids = LinkedStep.objects \
+            .annotate(length=Length('rank')) \
+            .filter(length__gt=options['max_length']) \
+            .values_list('super_id', flat=True) \
+            .distinct()
+        super_ids = list(super_ids)
+
+        for super_id in super_ids:
+            LinkedStep.rebalance(super_id)
+
+        self.stdout.write(f'Rebalanced {len(super_ids)} super steps')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.models.statistics import Statistics
+
+
+class Command(BaseCommand):
+    help = 'Recounts the statistics counters and fixes any drift'
+
+    def handle(self, *args, **options):
+        statistics, drift = Statistics.reconcile()
+
+        for name, previous in drift.items():
+            self.stdout.write(
+                f'Fixed {name}: {previous} -> {getattr(statistics, name)}')
+        self.stdout.write(f'Reconciled statistics, {len(drift)} drifted')
@@ -0,0 +1,76 @@
+# Generated by Django 4.0.6 on 2026-10-18 17:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Counts the paths one level deeper at a time from the level above, rather
+# than listing every path, which grows exponentially with shared steps.
+# Links made before circular references were rejected can form cycles, on
+# which the levels would never run out. A cycle shows as a step becoming its
+# own ancestor, so the migration fails there.
+BACKFILL_SQL = '''
+    DO $$
+    DECLARE
+        level integer := 1;
+        cycle_step integer;
+    BEGIN
+        INSERT INTO api_stepclosure (ancestor_id, descendant_id, depth, paths)
+        SELECT super_id, sub_id, 1, COUNT(*)
+          FROM api_linkedstep
+         GROUP BY super_id, sub_id;
+
+        LOOP
+            SELECT ancestor_id INTO cycle_step
+              FROM api_stepclosure
+             WHERE depth = level AND ancestor_id = descendant_id
+             LIMIT 1;
+            IF cycle_step IS NOT NULL THEN
+                RAISE EXCEPTION 'Linked steps contain a cycle through step '
+                                'id %, unlink it before migrating',
+                                cycle_step;
+            END IF;
+
+            INSERT INTO api_stepclosure
+                   (ancestor_id, descendant_id, depth, paths)
+            SELECT closure.ancestor_id, linked.sub_id, level + 1,
+                   SUM(closure.paths)
+              FROM api_stepclosure closure
+             INNER JOIN api_linkedstep linked
+                ON linked.super_id = closure.descendant_id
+             WHERE closure.depth = level
+             GROUP BY closure.ancestor_id, linked.sub_id;
+            EXIT WHEN NOT FOUND;
+            level := level + 1;
+        END LOOP;
+    END
+    $$
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_publishedsequence_publishedstep_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StepClosure',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('depth', models.PositiveIntegerField()),
+                ('paths', models.PositiveBigIntegerField(default=1)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='step_closure_ancestor', to='api.step')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='step_closure_descendant', to='api.step')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stepclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant', 'depth'), name='unique_step_closure_path'),
+        ),
+        migrations.RunSQL(
+            sql=BACKFILL_SQL,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
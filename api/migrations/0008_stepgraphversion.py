@@ -0,0 +1,21 @@
+# Generated by Django 4.0.6 on 2026-10-18 17:49
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_stepclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StepGraphVersion',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('version', models.UUIDField(default=uuid.uuid4)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.6 on 2026-10-18 17:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_stepgraphversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceSnapshot',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('base_url', models.CharField(max_length=256)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+                ('content', models.BinaryField(null=True)),
+                ('sequence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sequence_snapshot', to='api.sequence')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sequencesnapshot',
+            constraint=models.UniqueConstraint(fields=('sequence', 'base_url'), name='unique_sequence_snapshot'),
+        ),
+    ]
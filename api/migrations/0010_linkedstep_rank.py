@@ -0,0 +1,57 @@
+# Generated by Django 4.0.6 on 2026-10-18 19:02
+
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import migrations, models
+
+from api.functions.ranks import balanced_ranks
+
+
+def rank_linked_steps(apps, schema_editor):
+    LinkedStep = apps.get_model('api', 'LinkedStep')
+    linked_steps = LinkedStep.objects.order_by('super_id', 'pos', 'id')
+    for _, group in groupby(linked_steps, key=attrgetter('super_id')):
+        group = list(group)
+        for linked_step, rank in zip(group, balanced_ranks(len(group))):
+            linked_step.rank = rank
+        LinkedStep.objects.bulk_update(group, ['rank'])
+
+
+def position_linked_steps(apps, schema_editor):
+    LinkedStep = apps.get_model('api', 'LinkedStep')
+    linked_steps = LinkedStep.objects.order_by('super_id', 'rank')
+    for _, group in groupby(linked_steps, key=attrgetter('super_id')):
+        group = list(group)
+        for pos, linked_step in enumerate(group):
+            linked_step.pos = pos
+        LinkedStep.objects.bulk_update(group, ['pos'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_sequencesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linkedstep',
+            name='rank',
+            field=models.CharField(db_collation='C', max_length=255, null=True),
+        ),
+        migrations.RunPython(rank_linked_steps, position_linked_steps),
+        migrations.AlterField(
+            model_name='linkedstep',
+            name='rank',
+            field=models.CharField(db_collation='C', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='linkedstep',
+            name='pos',
+        ),
+        migrations.AddConstraint(
+            model_name='linkedstep',
+            constraint=models.UniqueConstraint(deferrable=models.Deferrable['IMMEDIATE'], fields=('super', 'rank'), name='unique_linked_step_rank'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_image_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Statistics',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('sequences', models.IntegerField(default=0)),
+                ('steps', models.IntegerField(default=0)),
+                ('super', models.IntegerField(default=0)),
+                ('sub', models.IntegerField(default=0)),
+                ('images', models.IntegerField(default=0)),
+                ('text_modules', models.IntegerField(default=0)),
+                ('code_modules', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'statistics',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_statistics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sequence',
+            index=models.Index(fields=['updated', 'id'], name='sequence_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sequence',
+            index=models.Index(fields=['created', 'id'], name='sequence_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sequence',
+            index=models.Index(fields=['published', 'id'], name='sequence_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['updated', 'id'], name='step_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['created', 'id'], name='step_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['title', 'id'], name='step_title_idx'),
+        ),
+    ]
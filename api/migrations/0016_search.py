@@ -0,0 +1,95 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:26
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Titles are not in any one language, so they are indexed without stemming
+TRIGGERS = '''
+    CREATE FUNCTION api_step_search() RETURNS trigger AS $$
+    BEGIN
+        NEW.search := setweight(
+            to_tsvector('simple', coalesce(NEW.title, '')), 'A');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER api_step_search
+    BEFORE INSERT OR UPDATE OF title, search ON api_step
+    FOR EACH ROW EXECUTE FUNCTION api_step_search();
+
+    CREATE FUNCTION api_explanation_search() RETURNS trigger AS $$
+    BEGIN
+        NEW.search :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.content, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER api_explanation_search
+    BEFORE INSERT OR UPDATE OF title, content, search ON api_explanation
+    FOR EACH ROW EXECUTE FUNCTION api_explanation_search();
+
+    UPDATE api_step SET search = NULL;
+    UPDATE api_explanation SET search = NULL;
+'''
+
+DROP_TRIGGERS = '''
+    DROP TRIGGER api_step_search ON api_step;
+    DROP FUNCTION api_step_search();
+    DROP TRIGGER api_explanation_search ON api_explanation;
+    DROP FUNCTION api_explanation_search();
+'''
+
+# Trigram matching is optional, pg_trgm is not available everywhere
+TRIGRAM_INDEXES = '''
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT FROM pg_available_extensions
+                    WHERE name = 'pg_trgm') THEN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX step_title_trgm_idx
+                ON api_step USING gin (title gin_trgm_ops);
+            CREATE INDEX explanation_title_trgm_idx
+                ON api_explanation USING gin (title gin_trgm_ops);
+        END IF;
+    END
+    $$;
+'''
+
+DROP_TRIGRAM_INDEXES = '''
+    DROP INDEX IF EXISTS step_title_trgm_idx;
+    DROP INDEX IF EXISTS explanation_title_trgm_idx;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_list_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='explanation',
+            name='search',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='step',
+            name='search',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='explanation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search'], name='explanation_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='step',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search'], name='step_search_idx'),
+        ),
+        migrations.RunSQL(TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(TRIGRAM_INDEXES, DROP_TRIGRAM_INDEXES),
+    ]
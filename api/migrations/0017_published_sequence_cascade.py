@@ -0,0 +1,29 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='publishedsequence',
+            name='sequence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sequence_published_sequence', to='api.sequence'),
+        ),
+        migrations.AlterField(
+            model_name='publishedstep',
+            name='published_sequence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='published_step_published_sequence', to='api.publishedsequence'),
+        ),
+        migrations.AlterField(
+            model_name='publishedstep',
+            name='sequence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='published_step_sequence', to='api.sequence'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_published_sequence_cascade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publishedstep',
+            name='content',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+# Blobs whose variants were already generated take them from their images
+BACKFILL_SQL = '''
+UPDATE image_blob SET variants = (
+    SELECT api_image.variants FROM api_image
+    WHERE api_image.blob_id = image_blob.id
+      AND api_image.variants <> '[]'::jsonb
+    LIMIT 1)
+WHERE EXISTS (
+    SELECT 1 FROM api_image
+    WHERE api_image.blob_id = image_blob.id
+      AND api_image.variants <> '[]'::jsonb);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_publishedstep_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='variants',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
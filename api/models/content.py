@@ -1,13 +1,21 @@
+import os
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
+from api.functions.storage_deletion import delete_files
+from api.models.statistics import Statistics
 from api.models.step import Step
 
 
 class Explanation(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     TYPE_CHOICES = (
         ('text', 'Text'),
         ('code', 'Code'),
@@ -17,12 +25,112 @@ class Explanation(models.Model):
     updated = models.DateTimeField(auto_now=True)
     title = models.CharField(max_length=128, blank=True)
     content = models.CharField(max_length=4096, blank=True)
+    # Maintained from the title and content by a database trigger
+    search = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search'], name='explanation_search_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if self._state.adding:
+                previous = None
+            else:
+                previous = Explanation.objects.filter(pk=self.pk) \
+                                              .values_list('type', flat=True) \
+                                              .first()
+            super().save(*args, **kwargs)
+            if previous != self.type:
+                Statistics.add(**Explanation.counters(self.type, 1),
+                               **Explanation.counters(previous, -1))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Statistics.add(**Explanation.counters(self.type, -1))
+            return deleted
+
+    @staticmethod
+    def counters(type, delta):
+        if type in ['text', 'code']:
+            return {f'{type}_modules': delta}
+        return {}
+
+
+class ImageBlob(models.Model):
+    """
+    A stored image file, shared by all images with the same content and
+    deleted from storage with the last of them. Its variants are generated
+    once and copied to every image of the blob.
+    """
+    id = models.AutoField(primary_key=True)
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    references = models.IntegerField(default=0)
+    variants = models.JSONField(default=list)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'image_blob'
+
+    @classmethod
+    def acquire(cls, sha256, file):
+        """
+        Returns the blob with the given content hash and whether it was
+        created, storing file only when no blob has that content yet. The
+        blob's reference is taken in the current transaction.
+        """
+        blob = cls._reference(sha256)
+        if blob is not None:
+            return blob, False
+
+        extension = os.path.splitext(file.name)[1].lower()
+        storage = Image._meta.get_field('image').storage
+        name = storage.save(f'{uuid.uuid4()}{extension}', file)
+        try:
+            with transaction.atomic():
+                return cls.objects.create(sha256=sha256,
+                                          name=name,
+                                          size=file.size,
+                                          references=1), True
+        except IntegrityError:
+            # A concurrent upload of the same content stored it first
+            storage.delete(name)
+            return cls._reference(sha256), False
+
+    @classmethod
+    def _reference(cls, sha256):
+        updated = cls.objects.filter(sha256=sha256) \
+            .update(references=F('references') + 1)
+        if updated:
+            return cls.objects.get(sha256=sha256)
+        return None
+
+    @classmethod
+    def release(cls, pk):
+        """
+        Drops a reference to the blob, deleting it once none are left.
+        Returns whether the blob was deleted.
+        """
+        cls.objects.filter(pk=pk).update(references=F('references') - 1)
+        return cls.objects.filter(pk=pk, references__lte=0).delete()[0] > 0
 
 
 class Image(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     image = models.ImageField(blank=True, null=True)
+    blob = models.ForeignKey(
+        ImageBlob,
+        on_delete=models.PROTECT,
+        related_name='images',
+        blank=True,
+        null=True
+    )
+    variants = models.JSONField(default=list)
     title = models.CharField(max_length=128, blank=True)
     caption = models.CharField(max_length=128, blank=True, null=True)
     created = models.DateTimeField(auto_now_add=True)
@@ -32,10 +140,88 @@ class Image(models.Model):
     def type(self):
         return 'image'
 
+    @property
+    def url(self):
+        key = Image.url_key(self.uuid)
+        url = cache.get(key)
+        if url is None and self.image:
+            url = self.image.url
+            cache.set(key, url, timeout=settings.IMAGE_URL_CACHE_TIMEOUT)
+        return url
+
+    @staticmethod
+    def url_key(uuid):
+        return f'image-url:{uuid}'
+
+    @classmethod
+    def urls(cls, uuids):
+        """
+        Returns the storage urls of the images with the given uuids. Signing
+        an url takes a storage call, so urls are cached for less than they
+        are valid. Images without a cached url are read with one query.
+        """
+        keys = {cls.url_key(uuid): uuid for uuid in uuids}
+        urls = cache.get_many(keys)
+
+        missing = [uuid for key, uuid in keys.items() if key not in urls]
+        if missing:
+            images = cls.objects.filter(uuid__in=missing).only('uuid', 'image')
+            signed = {cls.url_key(image.uuid): image.image.url
+                      for image in images if image.image}
+            cache.set_many(signed, timeout=settings.IMAGE_URL_CACHE_TIMEOUT)
+            urls.update(signed)
+
+        return {uuid: urls[key] for key, uuid in keys.items() if key in urls}
+
+    def variant(self, width=None, webp=False):
+        """
+        Returns the stored name of the smallest variant at least width
+        pixels wide, or of the largest one. WebP variants are only picked
+        when webp is set. Falls back to the original until variants exist.
+        """
+        variants = [variant for variant in self.variants
+                    if webp or variant['format'] != 'webp']
+        if not variants:
+            return self.image.name
+
+        # WebP wins between variants of the same width
+        def key(variant):
+            return variant['width'], variant['format'] != 'webp'
+
+        if width is not None:
+            wide_enough = [i for i in variants if i['width'] >= width]
+            if wide_enough:
+                return min(wide_enough, key=key)['name']
+        widest = max(i['width'] for i in variants)
+        return min((i for i in variants if i['width'] == widest),
+                   key=key)['name']
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Statistics.add(images=1)
+        cache.delete(Image.url_key(self.uuid))
+
+    def delete(self, *args, **kwargs):
+        cache.delete(Image.url_key(self.uuid))
+        names = {self.image.name} | {i['name'] for i in self.variants}
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Statistics.add(images=-1)
+            # Shared files stay until the last image using them is deleted
+            if self.blob_id is None or ImageBlob.release(self.blob_id):
+                delete_files(self.image.storage, sorted(names, key=str))
+        return deleted
+
 
 class Module(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(blank=False, null=False, default=uuid.uuid4)
+    uuid = models.UUIDField(blank=False,
+                            null=False,
+                            default=uuid.uuid4,
+                            unique=True)
     explanation = models.ForeignKey(
         Explanation,
         on_delete=models.CASCADE,
@@ -55,7 +241,10 @@ class Module(models.Model):
 
 class StepModule(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(blank=False, null=False, default=uuid.uuid4)
+    uuid = models.UUIDField(blank=False,
+                            null=False,
+                            default=uuid.uuid4,
+                            unique=True)
     step = models.ForeignKey(
         Step,
         on_delete=models.CASCADE,
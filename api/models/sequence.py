@@ -1,8 +1,44 @@
 import uuid
 
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Q
 
-from api.models.step import Step
+from api.base.exceptions import CircularReference, NothingToPublish
+from api.models.content import Explanation, Image, Module, StepModule
+from api.models.statistics import Statistics
+from api.models.step import LinkedStep, Step, StepClosure
+
+
+PUBLISH_STEPS_QUERY = '''
+    INSERT INTO {published_step}
+           (uuid, title, content, first, previous, next,
+            published_sequence_id, sequence_id)
+    SELECT flat.uuid,
+           COALESCE(step.title, ''),
+           COALESCE((
+               SELECT string_agg(
+                          COALESCE(explanation.content,
+                                   '[[img|' || image.uuid || ']]'),
+                          E'\\n\\n' ORDER BY step_module.pos)
+                 FROM {step_module} step_module
+                INNER JOIN {module} module
+                   ON module.id = step_module.module_id
+                 LEFT JOIN {explanation} explanation
+                   ON explanation.id = module.explanation_id
+                 LEFT JOIN {image} image ON image.id = module.image_id
+                WHERE step_module.step_id = flat.step_id
+                  AND (explanation.id IS NOT NULL OR image.id IS NOT NULL)
+           ), ''),
+           %(first)s::uuid,
+           LAG(flat.uuid) OVER ordered,
+           LEAD(flat.uuid) OVER ordered,
+           %(published_sequence)s,
+           %(sequence)s
+      FROM unnest(%(uuids)s::uuid[], %(steps)s::integer[])
+           WITH ORDINALITY AS flat(uuid, step_id, pos)
+     INNER JOIN {step} step ON step.id = flat.step_id
+    WINDOW ordered AS (ORDER BY flat.pos)
+'''
 
 
 class Sequence(models.Model):
@@ -20,15 +56,142 @@ class Sequence(models.Model):
 
     class Meta:
         db_table = 'sequence'
+        indexes = [
+            models.Index(fields=['updated', 'id'],
+                         name='sequence_updated_idx'),
+            models.Index(fields=['created', 'id'],
+                         name='sequence_created_idx'),
+            models.Index(fields=['published', 'id'],
+                         name='sequence_published_idx'),
+        ]
 
     @property
     def uuid(self):
         return self.step.uuid
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        # Saved on every publish, a savepoint would only add round trips
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                Statistics.add(sequences=1)
+            else:
+                SequenceSnapshot.objects.filter(sequence=self).invalidate()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Statistics.add(sequences=-1)
+            return deleted
+
+    def publish(self):
+        """
+        Flattens the tree below the sequence into published steps in depth
+        first order, each pointing to its neighbours, so guides never have
+        to walk the tree. The content of a published step joins its modules,
+        images as placeholders. All published steps are written by one
+        statement.
+        """
+        children = LinkedStep.graph().subtree(self.step_id)
+        order = []
+        # Shared steps are published wherever they appear, only a step
+        # below itself is refused, as it would be repeated endlessly
+        path = [self.step_id]
+        pending = [iter(children[self.step_id])]
+        while pending:
+            pk = next(pending[-1], None)
+            if pk is None:
+                pending.pop()
+                path.pop()
+                continue
+            if pk in path:
+                raise CircularReference(
+                    'Sequence contains a circular reference')
+            order.append(pk)
+            path.append(pk)
+            pending.append(iter(children[pk]))
+        if not order:
+            raise NothingToPublish
+
+        uuids = [str(uuid.uuid4()) for _ in order]
+        query = PUBLISH_STEPS_QUERY.format(
+            published_step=PublishedStep._meta.db_table,
+            step=Step._meta.db_table,
+            step_module=StepModule._meta.db_table,
+            module=Module._meta.db_table,
+            explanation=Explanation._meta.db_table,
+            image=Image._meta.db_table)
+
+        with transaction.atomic():
+            published_sequence = PublishedSequence.objects.create(
+                sequence=self,
+                title=self.step.title or '',
+                first=uuids[0])
+            with connection.cursor() as cursor:
+                cursor.execute(query, {
+                    'uuids': uuids,
+                    'steps': order,
+                    'first': uuids[0],
+                    'published_sequence': published_sequence.pk,
+                    'sequence': self.pk})
+
+            self.is_published = True
+            self.published = published_sequence.published
+            self.save()
+
+        return published_sequence
+
+
+class SequenceSnapshotQuerySet(models.QuerySet):
+    def invalidate(self):
+        return self.update(content=None, generation=F('generation') + 1)
+
+
+class SequenceSnapshot(models.Model):
+    """
+    Rendered JSON of a sequence and its whole step tree. Invalidation clears
+    the content and bumps the generation, a snapshot rendered concurrently
+    is only stored if the generation it started from is still current.
+    """
+    id = models.AutoField(primary_key=True)
+    sequence = models.ForeignKey(
+        Sequence,
+        blank=False,
+        null=False,
+        on_delete=models.CASCADE,
+        related_name='sequence_snapshot')
+    base_url = models.CharField(max_length=256)
+    generation = models.PositiveBigIntegerField(default=0)
+    content = models.BinaryField(null=True)
+
+    objects = SequenceSnapshotQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sequence', 'base_url'],
+                                    name='unique_sequence_snapshot'),
+        ]
+
+    @classmethod
+    def invalidate_step(cls, step_id):
+        # A sequence changes with every step below it
+        ancestors = StepClosure.objects.filter(descendant_id=step_id) \
+                                       .values('ancestor')
+        cls.objects.filter(Q(sequence__step_id=step_id) |
+                           Q(sequence__step__in=ancestors)) \
+                   .invalidate()
+
+    def store(self, content):
+        self.content = content
+        return SequenceSnapshot.objects.filter(pk=self.pk,
+                                               generation=self.generation) \
+                                       .update(content=content)
+
 
 class PublishedSequence(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     published = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=128)
     first = models.UUIDField()
@@ -36,14 +199,15 @@ class PublishedSequence(models.Model):
         Sequence,
         blank=False,
         null=False,
-        on_delete=models.PROTECT,
+        on_delete=models.CASCADE,
         related_name='sequence_published_sequence')
 
 
 class PublishedStep(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(default=uuid.uuid4)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True)
     title = models.CharField(max_length=128)
+    content = models.TextField(blank=True, default='')
 
     first = models.UUIDField()
     previous = models.UUIDField(null=True)
@@ -53,11 +217,11 @@ class PublishedStep(models.Model):
         PublishedSequence,
         blank=False,
         null=False,
-        on_delete=models.PROTECT,
+        on_delete=models.CASCADE,
         related_name='published_step_published_sequence')
     sequence = models.ForeignKey(
         Sequence,
         blank=False,
         null=False,
-        on_delete=models.PROTECT,
+        on_delete=models.CASCADE,
         related_name='published_step_sequence')
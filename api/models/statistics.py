@@ -0,0 +1,101 @@
+from django.db import connection, models, transaction
+from django.db.models import F
+
+
+COUNT_QUERY = '''
+    UPDATE {statistics}
+       SET sequences = (SELECT COUNT(*) FROM {sequence}),
+           steps = (SELECT COUNT(*) FROM {step} WHERE type <> 'SEQUENCE'),
+           super = (SELECT COUNT(*) FROM {linked_step}),
+           sub = (SELECT COUNT(*)
+                    FROM {step} step
+                   WHERE NOT EXISTS (SELECT
+                                       FROM {linked_step} linked_step
+                                      WHERE linked_step.super_id = step.id)),
+           images = (SELECT COUNT(*) FROM {image}),
+           text_modules = (SELECT COUNT(*)
+                             FROM {explanation}
+                            WHERE type = 'text'),
+           code_modules = (SELECT COUNT(*)
+                             FROM {explanation}
+                            WHERE type = 'code')
+     WHERE id = 1
+'''
+
+
+class Statistics(models.Model):
+    """
+    Single row of counters behind the statistics endpoint, kept up to date
+    by the write paths of the counted models. The row is created from a
+    full count the first time it is needed.
+    """
+    COUNTERS = ['sequences', 'steps', 'super', 'sub', 'images',
+                'text_modules', 'code_modules']
+
+    id = models.AutoField(primary_key=True)
+    sequences = models.IntegerField(default=0)
+    steps = models.IntegerField(default=0)
+    super = models.IntegerField(default=0)
+    sub = models.IntegerField(default=0)
+    images = models.IntegerField(default=0)
+    text_modules = models.IntegerField(default=0)
+    code_modules = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'statistics'
+
+    @property
+    def modules(self):
+        return self.images + self.text_modules + self.code_modules
+
+    @classmethod
+    def current(cls):
+        statistics = cls.objects.filter(id=1).first()
+        if statistics is None:
+            statistics, _ = cls.reconcile()
+        return statistics
+
+    @classmethod
+    def add(cls, **deltas):
+        """
+        Adds deltas to the counters, after the counted rows were written in
+        the same transaction.
+        """
+        deltas = {name: F(name) + int(delta)
+                  for name, delta in deltas.items() if delta}
+        if deltas and not cls.objects.filter(id=1).update(**deltas):
+            cls.reconcile()
+
+    @classmethod
+    def reconcile(cls):
+        """
+        Recounts all counters in one statement. Returns the statistics and
+        the counters that had drifted, with their previous values.
+        """
+        with transaction.atomic():
+            # Once the row is locked, writes still to come wait for it and
+            # the count below sees every write that got to it first
+            statistics, created = cls.objects.select_for_update() \
+                                             .get_or_create(id=1)
+            with connection.cursor() as cursor:
+                cursor.execute(COUNT_QUERY.format(**cls._tables()))
+            previous, statistics = statistics, cls.objects.get(id=1)
+
+        drift = {name: getattr(previous, name) for name in cls.COUNTERS
+                 if not created and
+                 getattr(previous, name) != getattr(statistics, name)}
+        return statistics, drift
+
+    @classmethod
+    def _tables(cls):
+        # Imported here, the models import this module to count their writes
+        from api.models.content import Explanation, Image
+        from api.models.sequence import Sequence
+        from api.models.step import LinkedStep, Step
+
+        return {'statistics': cls._meta.db_table,
+                'sequence': Sequence._meta.db_table,
+                'step': Step._meta.db_table,
+                'linked_step': LinkedStep._meta.db_table,
+                'image': Image._meta.db_table,
+                'explanation': Explanation._meta.db_table}
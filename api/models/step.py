@@ -1,13 +1,89 @@
 import uuid
+import zlib
 
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
 
 from api.base.choices import StepChoices
+from api.functions.ranks import balanced_ranks, ranks_between
+from api.functions.step_graph import StepGraph
+from api.models.statistics import Statistics
+
+
+CLOSURE_PATHS_QUERY = '''
+    WITH sub(id) AS (
+        SELECT unnest(%(subs)s::integer[])
+    ),
+    ancestor(id, depth, paths) AS (
+        SELECT ancestor_id, depth, paths
+          FROM {closure}
+         WHERE descendant_id = %(super)s
+         UNION ALL
+        SELECT %(super)s, 0, 1
+    ),
+    descendant(id, depth, paths) AS (
+        SELECT closure.descendant_id, closure.depth, closure.paths
+          FROM sub
+         INNER JOIN {closure} closure ON closure.ancestor_id = sub.id
+         UNION ALL
+        SELECT id, 0, 1
+          FROM sub
+    ),
+    path(ancestor_id, descendant_id, depth, paths) AS (
+        SELECT ancestor.id,
+               descendant.id,
+               ancestor.depth + descendant.depth + 1,
+               SUM(ancestor.paths * descendant.paths)
+          FROM ancestor
+         CROSS JOIN descendant
+         GROUP BY 1, 2, 3
+    )
+'''
+
+CLOSURE_LINK_QUERY = CLOSURE_PATHS_QUERY + '''
+    INSERT INTO {closure} (ancestor_id, descendant_id, depth, paths)
+    SELECT ancestor_id, descendant_id, depth, paths
+      FROM path
+        ON CONFLICT (ancestor_id, descendant_id, depth)
+        DO UPDATE SET paths = {closure}.paths + EXCLUDED.paths
+'''
+
+CLOSURE_UNLINK_QUERY = CLOSURE_PATHS_QUERY + ''',
+    removed AS (
+        DELETE FROM {closure} closure
+         USING path
+         WHERE closure.ancestor_id = path.ancestor_id
+           AND closure.descendant_id = path.descendant_id
+           AND closure.depth = path.depth
+           AND closure.paths <= path.paths
+    )
+    UPDATE {closure} closure
+       SET paths = closure.paths - path.paths
+      FROM path
+     WHERE closure.ancestor_id = path.ancestor_id
+       AND closure.descendant_id = path.descendant_id
+       AND closure.depth = path.depth
+       AND closure.paths > path.paths
+'''
+
+RERANK_QUERY = '''
+    UPDATE {linked_step} linked
+       SET rank = ranking.rank
+      FROM (VALUES {values}) AS ranking(id, rank)
+     WHERE linked.id = ranking.id
+'''
 
 
 class Step(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(blank=False, null=False, default=uuid.uuid4)
+    uuid = models.UUIDField(blank=False,
+                            null=False,
+                            default=uuid.uuid4,
+                            unique=True)
     created = models.DateTimeField(blank=False, null=False, auto_now_add=True)
     updated = models.DateTimeField(blank=False, null=False, auto_now=True)
     title = models.CharField(max_length=128, blank=True, null=True)
@@ -16,38 +92,108 @@ class Step(models.Model):
                             null=False,
                             choices=StepChoices.choices,
                             default=StepChoices.STEP)
+    # Maintained from the title by a database trigger
+    search = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        # Keyset pagination orders lists by one of these and the id
+        indexes = [
+            models.Index(fields=['updated', 'id'], name='step_updated_idx'),
+            models.Index(fields=['created', 'id'], name='step_created_idx'),
+            models.Index(fields=['title', 'id'], name='step_title_idx'),
+            GinIndex(fields=['search'], name='step_search_idx'),
+        ]
 
     def __str__(self):
         return f'{self.uuid}'
 
+    def get_tree(self, depth=None):
+        return StepTree.load(self, depth)
+
     @property
     def linked(self):
-        linked_steps = LinkedStep.objects.filter(super=self).order_by('pos')
+        linked_steps = LinkedStep.objects.filter(super=self).order_by('rank')
         return [linked_step.sub for linked_step in linked_steps]
 
-    def get_parent_pks(self):
-        try:
-            linked_steps = LinkedStep.objects.filter(sub=self)
-        except LinkedStep.DoesNotExist:
-            return []
+    def ancestors(self):
+        ancestors = StepClosure.objects.filter(descendant=self) \
+                                       .values('ancestor')
+        return Step.objects.filter(pk__in=ancestors)
 
-        parents = [li.super for li in linked_steps]
+    def descendants(self):
+        descendants = StepClosure.objects.filter(ancestor=self) \
+                                         .values('descendant')
+        return Step.objects.filter(pk__in=descendants)
 
-        parent_pks = []
-        for parent in parents:
-            parent_pks = parent.get_parent_pks()
+    @classmethod
+    def tree_validators(cls, uuid):
+        """
+        Returns the latest update within the tree below the step with uuid,
+        including the sequence on top of it, and the number of steps in it.
+        Linking touches the super step, so together they change with every
+        change to the tree. Uses a single query.
+        """
+        descendants = StepClosure.objects.filter(ancestor__uuid=uuid) \
+                                         .values('descendant')
+        result = cls.objects.filter(Q(uuid=uuid) | Q(pk__in=descendants)) \
+                            .aggregate(updated=Max('updated'),
+                                       sequence=Max('step_sequence__updated'),
+                                       count=Count('pk'))
 
-        return [parent.pk for parent in parents] + parent_pks
+        updated = [result['updated'], result['sequence']]
+        return max(filter(None, updated), default=None), result['count']
 
     def update_type(self, type):
         self.type = type
         self.save()
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding:
+                previous = None
+            else:
+                previous = Step.objects.filter(pk=self.pk) \
+                                       .values_list('type', flat=True) \
+                                       .first()
+            super().save(*args, **kwargs)
+            if adding:
+                Statistics.add(steps=Step.counted(self.type), sub=1)
+            else:
+                # Steps turned into sequences or back change the count
+                Statistics.add(steps=Step.counted(self.type) -
+                               Step.counted(previous))
+                invalidate_snapshots(self.pk)
+
+    @staticmethod
+    def counted(type):
+        return type is not None and type != StepChoices.SEQUENCE
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            StepClosure.lock()
+            linked_steps = LinkedStep.objects.filter(Q(super=self) |
+                                                     Q(sub=self))
+            for linked_step in linked_steps:
+                linked_step.delete()
+            deleted = super().delete(*args, **kwargs)
+            # The sequence on top of the step goes with it
+            Statistics.add(steps=-Step.counted(self.type),
+                           sub=-1,
+                           sequences=-deleted[1].get('api.Sequence', 0))
+            return deleted
+
 
 class LinkedStep(models.Model):
     id = models.AutoField(primary_key=True)
-    uuid = models.UUIDField(blank=False, null=False, default=uuid.uuid4)
-    pos = models.IntegerField(blank=False, null=False, default=0)
+    uuid = models.UUIDField(blank=False,
+                            null=False,
+                            default=uuid.uuid4,
+                            unique=True)
+    rank = models.CharField(max_length=255,
+                            blank=False,
+                            null=False,
+                            db_collation='C')
     super = models.ForeignKey(Step,
                               blank=False,
                               null=False,
@@ -58,3 +204,317 @@ class LinkedStep(models.Model):
                             null=False,
                             on_delete=models.CASCADE,
                             related_name='linked_step_sub')
+
+    class Meta:
+        constraints = [
+            # Checked per statement, so that reranking can swap ranks
+            models.UniqueConstraint(fields=['super', 'rank'],
+                                    name='unique_linked_step_rank',
+                                    deferrable=models.Deferrable.IMMEDIATE),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding:
+                StepClosure.lock()
+            if adding and not self.rank:
+                self.rank = LinkedStep.allocate_ranks(self.super_id, None)[0]
+            super().save(*args, **kwargs)
+            if adding:
+                StepClosure.link(self.super_id, [self.sub_id])
+                count = LinkedStep.objects.filter(super=self.super_id) \
+                                          .count()
+                links_counted(count - 1, count)
+            links_changed(self.super_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            StepClosure.lock()
+            LinkedStep._lock_super(self.super_id)
+            StepClosure.unlink(self.super_id, [self.sub_id])
+            links_changed(self.super_id)
+            deleted = super().delete(*args, **kwargs)
+            count = LinkedStep.objects.filter(super=self.super_id).count()
+            links_counted(count + 1, count)
+            return deleted
+
+    def move(self, pos):
+        """
+        Moves the linked step to position pos among its siblings by writing
+        its rank only.
+        """
+        with transaction.atomic():
+            self.rank = LinkedStep.allocate_ranks(self.super_id,
+                                                  pos,
+                                                  exclude=self.pk)[0]
+            self.save(update_fields=['rank'])
+
+    @classmethod
+    def allocate_ranks(cls, super_id, pos, count=1, exclude=None):
+        """
+        Returns count ranks for linked steps inserted at position pos below
+        super, or after the last linked step if pos is None.
+        """
+        cls._lock_super(super_id)
+        ranks = cls.objects.filter(super_id=super_id) \
+                           .exclude(pk=exclude) \
+                           .order_by('rank') \
+                           .values_list('rank', flat=True)
+        before, after = None, None
+        if pos == 0:
+            after = ranks.first()
+        elif pos is not None:
+            neighbours = list(ranks[pos - 1:pos + 1])
+            if neighbours:
+                before = neighbours[0]
+                after = neighbours[1] if len(neighbours) > 1 else None
+            else:
+                before = ranks.last()
+        else:
+            before = ranks.last()
+
+        new_ranks = ranks_between(before, after, count)
+        if len(max(new_ranks, key=len)) > cls._meta.get_field('rank') \
+                                             .max_length:
+            cls.rebalance(super_id)
+            return cls.allocate_ranks(super_id, pos, count, exclude)
+        return new_ranks
+
+    @classmethod
+    def bulk_link(cls, super, subs, pos=None):
+        """
+        Links subs below super as a block starting at position pos, or after
+        the last linked step.
+        """
+        with transaction.atomic():
+            StepClosure.lock()
+            count = cls.objects.filter(super=super).count()
+            if pos is None or pos > count:
+                pos = count
+            ranks = cls.allocate_ranks(super.pk, pos, len(subs))
+
+            linked_steps = cls.objects.bulk_create(
+                cls(super=super, sub=sub, rank=rank)
+                for sub, rank in zip(subs, ranks))
+
+            StepClosure.link(super.pk, [sub.pk for sub in subs])
+            links_counted(count, count + len(subs))
+            links_changed(super.pk)
+
+        for i, linked_step in enumerate(linked_steps):
+            linked_step.pos = pos + i
+        return linked_steps
+
+    @classmethod
+    def reorder(cls, super_id, linked_steps):
+        """
+        Stores the order of linked_steps, all linked steps of super, as
+        evenly spaced ranks with a single statement.
+        """
+        ranks = balanced_ranks(len(linked_steps))
+        query = RERANK_QUERY.format(
+            linked_step=cls._meta.db_table,
+            values=', '.join(['(%s, %s)'] * len(linked_steps)))
+        params = [value for linked_step, rank in zip(linked_steps, ranks)
+                  for value in (linked_step.pk, rank)]
+
+        with transaction.atomic():
+            cls._lock_super(super_id)
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+            links_changed(super_id)
+
+    @classmethod
+    def rebalance(cls, super_id):
+        """
+        Replaces the ranks below super, which grow with every insert between
+        two neighbours, by the shortest ranks keeping the order.
+        """
+        with transaction.atomic():
+            cls._lock_super(super_id)
+            linked_steps = cls.objects.filter(super_id=super_id) \
+                                      .order_by('rank') \
+                                      .only('id')
+            if linked_steps:
+                cls.reorder(super_id, list(linked_steps))
+
+    @classmethod
+    def locked_below(cls, super_id):
+        """
+        Returns the linked steps below super in order. Super stays locked
+        against inserts, moves and deletes until the transaction ends.
+        """
+        cls._lock_super(super_id)
+        return cls.objects.filter(super_id=super_id).order_by('rank')
+
+    @staticmethod
+    def _lock_super(super_id):
+        # Serializes rank allocation and counting of the linked steps below
+        # a super step. A no key lock leaves the foreign key checks of links
+        # to the step free, which would otherwise deadlock at commit.
+        Step.objects.select_for_update(no_key=True) \
+                    .filter(pk=super_id).exists()
+
+    @classmethod
+    def graph(cls):
+        # The version is read before the edges, a graph built from newer
+        # edges is then rebuilt once more instead of being served stale
+        version = StepGraphVersion.current()
+        edges = cls.objects.order_by('super_id', 'rank') \
+                           .values_list('super_id', 'sub_id')
+        return StepGraph.load(settings.STEP_GRAPH_PATH, version, edges.all)
+
+
+class StepClosure(models.Model):
+    """
+    Transitive closure of the step graph. Every row counts the paths of a
+    given depth leading from an ancestor down to a descendant, which keeps
+    the table exact when one of several paths is unlinked.
+    """
+    id = models.AutoField(primary_key=True)
+    ancestor = models.ForeignKey(Step,
+                                 blank=False,
+                                 null=False,
+                                 on_delete=models.CASCADE,
+                                 related_name='step_closure_ancestor')
+    descendant = models.ForeignKey(Step,
+                                   blank=False,
+                                   null=False,
+                                   on_delete=models.CASCADE,
+                                   related_name='step_closure_descendant')
+    depth = models.PositiveIntegerField(blank=False, null=False)
+    paths = models.PositiveBigIntegerField(blank=False, null=False, default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant', 'depth'],
+                                    name='unique_step_closure_path'),
+        ]
+
+    @classmethod
+    def lock(cls):
+        # Serializes concurrent graph writes so that two links can not pass
+        # the cycle check against each other, and link and unlink never
+        # work from each other's stale closure rows. Every writer takes it
+        # before any step row lock, and holds it until the transaction ends.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                           [zlib.crc32(cls._meta.db_table.encode())])
+
+    # Callers hold the lock, see lock()
+    @classmethod
+    def link(cls, super_id, sub_ids):
+        cls._execute(CLOSURE_LINK_QUERY, super_id, sub_ids)
+
+    @classmethod
+    def unlink(cls, super_id, sub_ids):
+        cls._execute(CLOSURE_UNLINK_QUERY, super_id, sub_ids)
+
+    @classmethod
+    def _execute(cls, query, super_id, sub_ids):
+        query = query.format(closure=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(query, {'super': super_id, 'subs': list(sub_ids)})
+
+
+class StepGraphVersion(models.Model):
+    """
+    Single row identifying the current state of the step graph. Every write
+    to LinkedStep replaces the version, which makes workers rebuild their
+    StepGraph. A random value can not be reused by a rolled back write.
+    """
+    id = models.AutoField(primary_key=True)
+    version = models.UUIDField(blank=False, null=False, default=uuid.uuid4)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(id=1)[0].version
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(id=1).update(version=uuid.uuid4()):
+            cls.objects.create(id=1)
+
+
+def links_changed(super_id):
+    # Touching the super step moves the validators of every tree it is in
+    Step.objects.filter(pk=super_id).update(updated=timezone.now())
+    StepGraphVersion.bump()
+    invalidate_snapshots(super_id)
+
+
+def links_counted(before, after):
+    # A step is counted as super for each of its links and as sub while it
+    # has none
+    Statistics.add(super=after - before, sub=(after == 0) - (before == 0))
+
+
+def invalidate_snapshots(step_id):
+    # Imported here, api.models.sequence is defined on top of steps
+    from api.models.sequence import SequenceSnapshot
+
+    SequenceSnapshot.invalidate_step(step_id)
+
+
+class StepTree:
+    """
+    In-memory adjacency map of a step and the steps linked below it, down to
+    depth levels. The structure comes from the shared StepGraph, the steps
+    themselves from a single query. Children are ordered by their position.
+    """
+
+    def __init__(self, root, children, depth, child_counts):
+        self.root = root
+        self.children = children
+        self.depth = depth
+        self.child_counts = child_counts
+
+    @classmethod
+    def load(cls, root, depth=None, max_nodes=None):
+        """
+        Loads the tree below root level by level. Loading stops after depth
+        levels, or before the level that would take the tree, with shared
+        steps counted each time they appear, past max_nodes. The first level
+        is always loaded.
+        """
+        if max_nodes is None:
+            max_nodes = settings.STEP_TREE_MAX_NODES
+        graph = LinkedStep.graph()
+
+        subtree = {}
+        level = [root.pk]
+        nodes = 1
+        loaded = 0
+        while level and (depth is None or loaded < depth):
+            level_children = {pk: subtree[pk] if pk in subtree
+                              else graph.children(pk) for pk in level}
+            count = sum(len(level_children[pk]) for pk in level)
+            if loaded > 0 and nodes + count > max_nodes:
+                break
+
+            subtree.update(level_children)
+            nodes += count
+            level = [sub for pk in level for sub in subtree[pk]]
+            loaded += 1
+
+        # Steps on the last level are only counted, their children are not
+        # part of the tree
+        child_counts = {pk: len(graph.children(pk)) for pk in set(level)}
+        pks = {pk for subs in subtree.values() for pk in subs}
+        steps = Step.objects.in_bulk(pks)
+        steps[root.pk] = root
+
+        children = {}
+        for pk, subs in subtree.items():
+            children[pk] = [steps[sub] for sub in subs if sub in steps]
+
+        return cls(root, children, loaded, child_counts)
+
+    def linked(self, step):
+        return self.children.get(step.pk, [])
+
+    def child_count(self, step):
+        if step.pk in self.child_counts:
+            return self.child_counts[step.pk]
+        return len(self.linked(step))
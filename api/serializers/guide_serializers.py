@@ -1,15 +1,25 @@
-from rest_framework import serializers
-from api.models.step import SequenceGuide, SequenceGuideStep
+from rest_framework.serializers import (
+    CharField,
+    HyperlinkedIdentityField,
+    ModelSerializer,
+    UUIDField)
 
+from api.models.sequence import PublishedSequence, PublishedStep
+
+
+class SequenceGuideSerializer(ModelSerializer):
+    url = HyperlinkedIdentityField(view_name='api:guide', lookup_field='uuid')
 
-class SequenceGuideSerializer(serializers.ModelSerializer):
     class Meta:
-        model = SequenceGuide
-        fields = ('api_id', 'title', 'first')
+        model = PublishedSequence
+        fields = ('url', 'uuid', 'title', 'first', 'published')
+
 
+class StepGuideSerializer(ModelSerializer):
+    sequence = UUIDField(source='published_sequence.uuid')
+    sequence_title = CharField(source='published_sequence.title')
 
-class StepGuideSerializer(serializers.ModelSerializer):
     class Meta:
-        model = SequenceGuideStep
-        fields = ('api_id', 'sequence_title', 'title', 'first', 'previous',
-                  'next', 'decision_steps', 'content',)
+        model = PublishedStep
+        fields = ('uuid', 'sequence', 'sequence_title', 'title', 'content',
+                  'first', 'previous', 'next')
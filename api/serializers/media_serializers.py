@@ -1,20 +1,73 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from api.functions.image_uploads import read_upload_token
 from api.models.content import Image
 
 
 class ImageSerializer(serializers.ModelSerializer):
-    url = serializers.HyperlinkedIdentityField(view_name='image-detail',
-                                               lookup_field='api_id')
+    url = serializers.HyperlinkedIdentityField(view_name='api:image',
+                                               lookup_field='uuid')
+    image = serializers.SerializerMethodField()
 
     class Meta():
         model = Image
-        fields = ['api_id', 'type', 'image', 'title', 'caption', 'created',
+        fields = ['uuid', 'type', 'image', 'title', 'caption', 'created',
                   'updated', 'url', ]
 
+    def get_image(self, instance):
+        return instance.url
+
 
 class ImageDetailSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
     class Meta():
         model = Image
-        fields = ['api_id', 'type', 'image', 'title', 'caption', 'created',
+        fields = ['uuid', 'type', 'image', 'title', 'caption', 'created',
                   'updated', ]
+
+    def get_image(self, instance):
+        return instance.url
+
+
+class ImageRenderSerializer(serializers.Serializer):
+    w = serializers.IntegerField(min_value=1, required=False)
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    filename = serializers.RegexField(r'(?i)\.(gif|jpe?g|png|webp)$',
+                                      max_length=128)
+    content_type = serializers.ChoiceField(
+        ['image/gif', 'image/jpeg', 'image/png', 'image/webp'])
+    size = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.IMAGE_UPLOAD_MAX_SIZE)
+
+
+class UploadedPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1)
+    etag = serializers.CharField()
+
+
+class ImageFinalizeSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    title = serializers.CharField(max_length=128, required=False)
+    caption = serializers.CharField(max_length=128, required=False,
+                                    allow_null=True)
+    parts = UploadedPartSerializer(many=True, required=False)
+
+    def validate_token(self, value):
+        upload = read_upload_token(value)
+        if upload is None:
+            raise serializers.ValidationError('Invalid or expired token.')
+        if upload['uuid'] != str(self.context['uuid']):
+            raise serializers.ValidationError(
+                'Does not belong to this upload.')
+        return upload
+
+    def validate(self, data):
+        if data['token']['upload_id'] and not data.get('parts'):
+            raise serializers.ValidationError(
+                {'parts': 'Required to complete a multipart upload.'})
+        return data
@@ -1,7 +0,0 @@
-from rest_framework.serializers import Serializer
-
-
-class RecursiveSerializer(Serializer):
-    def to_representation(self, value):
-        serializer = self.parent.parent.__class__(value, context=self.context)
-        return serializer.data
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+
+class SearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=256)
+
+
+class SearchResultSerializer(serializers.Serializer):
+    VIEWS = {'step': 'api:step', 'sequence': 'api:sequence'}
+
+    kind = serializers.CharField()
+    uuid = serializers.UUIDField()
+    title = serializers.CharField()
+    rank = serializers.FloatField(source='search_rank')
+    url = serializers.SerializerMethodField()
+
+    def get_url(self, result):
+        view_name = self.VIEWS.get(result['kind'])
+        if view_name is None:
+            return None
+        return reverse(view_name,
+                       kwargs={'uuid': result['uuid']},
+                       request=self.context.get('request'))
@@ -2,12 +2,14 @@ from rest_framework.serializers import (
     CharField,
     ModelSerializer,
     HyperlinkedIdentityField,
+    SerializerMethodField,
     UUIDField)
 
 from api.base.choices import StepChoices
-from api.models.sequence import Sequence
+from api.models.sequence import PublishedSequence, Sequence
 from api.models.step import Step
-from api.serializers.step_serializers import StepSerializer
+from api.serializers.step_serializers import linked_data
+from core.lean import LeanSerializer
 
 
 class SequenceBaseSerializer(ModelSerializer):
@@ -18,14 +20,16 @@ class SequenceBaseSerializer(ModelSerializer):
 
 
 class SequenceSerializer(SequenceBaseSerializer):
-    linked = StepSerializer(many=True,
-                            read_only=True,
-                            source='step.linked')
+    linked = SerializerMethodField()
 
     class Meta:
         model = Sequence
         exclude = ['id', 'step']
 
+    def get_linked(self, instance):
+        tree = instance.step.get_tree(self.context.get('depth'))
+        return linked_data(instance.step, tree, self.context)
+
     def update(self, instance, validated_data):
         instance.step.title = validated_data['step']['title']
         instance.step.save()
@@ -42,3 +46,28 @@ class SequencesSerializer(SequenceBaseSerializer):
         step = Step.objects.create(type=StepChoices.SEQUENCE,
                                    title=validated_data['step']['title'])
         return Sequence.objects.create(step=step)
+
+
+class SequencesLeanSerializer(LeanSerializer):
+    fields = ('step__uuid', 'step__title', 'created', 'updated',
+              'is_published', 'published')
+
+    def to_representation(self, row):
+        published = row['published']
+        return {
+            'url': self.url('api:sequence', row['step__uuid']),
+            'uuid': str(row['step__uuid']),
+            'title': row['step__title'],
+            'created': self.datetime(row['created']),
+            'updated': self.datetime(row['updated']),
+            'is_published': row['is_published'],
+            'published': self.datetime(published) if published else None,
+        }
+
+
+class PublishedSequenceSerializer(ModelSerializer):
+    sequence = UUIDField(source='sequence.step.uuid')
+
+    class Meta:
+        model = PublishedSequence
+        exclude = ['id']
@@ -1,15 +1,23 @@
-from django.db.models import Max
+from django.db import transaction
 from rest_framework.serializers import (
     CharField,
     HyperlinkedIdentityField,
     IntegerField,
+    ListField,
     ModelSerializer,
+    Serializer,
+    SerializerMethodField,
     UUIDField)
 
 from api.base.choices import StepChoices
-from api.base.exceptions import NotAValidStepType
-from api.models.step import Step, LinkedStep
-from api.serializers.recursive_serializers import RecursiveSerializer
+from api.base.exceptions import (
+    CircularReference,
+    NotAValidOrder,
+    NotAValidStepType,
+    StepsNotFound)
+from api.functions.circular_reference import has_circular_reference
+from api.models.step import Step, LinkedStep, StepClosure
+from core.lean import LeanRepresentation, LeanSerializer
 
 
 class StepSerializer(ModelSerializer):
@@ -27,15 +35,20 @@ class StepSerializer(ModelSerializer):
 
     title = CharField(read_only=True)
     type = CharField(read_only=True)
-    linked = RecursiveSerializer(many=True)
+    linked = SerializerMethodField()
 
     class Meta:
         model = Step
-        exclude = ['id']
+        exclude = ['id', 'search']
         read_only_fields = ('url_link_step', 'url_order_linked_steps',
                             'url_delete_linked_step', 'uuid', 'created',
                             'updated', 'linked', 'url_linkable_steps')
 
+    def get_linked(self, instance):
+        tree = self.context.get('tree') or \
+            instance.get_tree(self.context.get('depth'))
+        return linked_data(instance, tree, self.context)
+
     def update(self, instance, validated_data):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -44,6 +57,68 @@ class StepSerializer(ModelSerializer):
         return instance
 
 
+class LinkedStepsLeanSerializer(LeanRepresentation):
+    """
+    Steps of a StepTree with the output of StepSerializer, and on the last
+    level as stubs with a link to expand them.
+    """
+
+    def step(self, step, tree, context):
+        return {
+            'url_linkable_steps': self.url('api:step-linkable', step.uuid),
+            'url_link_step': self.url('api:step-link', step.uuid),
+            'url_order_linked_steps': self.url('api:linked-step-order',
+                                               step.uuid),
+            'url_delete_linked_step': self.url('api:linked-step-delete',
+                                               step.uuid),
+            'title': step.title,
+            'type': step.type,
+            'linked': linked_data(step, tree, context),
+            'uuid': str(step.uuid),
+            'created': self.datetime(step.created),
+            'updated': self.datetime(step.updated),
+        }
+
+    def stub(self, step, tree):
+        url = self.url('api:step', step.uuid)
+        if self.context.get('depth'):
+            url = f'{url}?depth={self.context["depth"]}'
+        child_count = tree.child_count(step)
+        return {
+            'url_expand': url,
+            'child_count': child_count,
+            'has_children': child_count > 0,
+            'uuid': str(step.uuid),
+            'created': self.datetime(step.created),
+            'updated': self.datetime(step.updated),
+            'title': step.title,
+            'type': step.type,
+        }
+
+
+def linked_data(step, tree, context):
+    """
+    Serializes the steps linked below step, with the steps on the last level
+    of tree as stubs. With stream set in the context the steps are returned
+    as a generator, serialized only while the response is written.
+    """
+    level = context.get('level', 0) + 1
+    lean = context.get('lean') or LinkedStepsLeanSerializer(context)
+    context = {**context, 'tree': tree, 'level': level, 'lean': lean}
+    if level < tree.depth:
+        rows = (lean.step(sub, tree, context) for sub in tree.linked(step))
+    else:
+        rows = (lean.stub(sub, tree) for sub in tree.linked(step))
+
+    if context.get('stream'):
+        return rows
+    return list(rows)
+
+
+class TreeDepthSerializer(Serializer):
+    depth = IntegerField(min_value=1, required=False)
+
+
 class StepsSerializer(ModelSerializer):
     url = HyperlinkedIdentityField(view_name='api:step', lookup_field='uuid')
 
@@ -52,7 +127,7 @@ class StepsSerializer(ModelSerializer):
 
     class Meta:
         model = Step
-        exclude = ['id']
+        exclude = ['id', 'search']
         read_only_fields = ('uuid', 'created', 'updated')
 
     def validate_type(self, value):
@@ -64,6 +139,20 @@ class StepsSerializer(ModelSerializer):
         return Step.objects.create(**validated_data)
 
 
+class StepsLeanSerializer(LeanSerializer):
+    fields = ('uuid', 'created', 'updated', 'title', 'type')
+
+    def to_representation(self, row):
+        return {
+            'url': self.url('api:step', row['uuid']),
+            'title': row['title'],
+            'type': row['type'],
+            'uuid': str(row['uuid']),
+            'created': self.datetime(row['created']),
+            'updated': self.datetime(row['updated']),
+        }
+
+
 class LinkStepSerializer(ModelSerializer):
     super = UUIDField(read_only=True)
     sub = UUIDField()
@@ -71,20 +160,77 @@ class LinkStepSerializer(ModelSerializer):
 
     class Meta:
         model = LinkedStep
-        exclude = ['id']
+        exclude = ['id', 'rank']
 
+    @transaction.atomic
     def create(self, validated_data):
         super = Step.objects.get(uuid=self.context['uuid'])
         sub = Step.objects.get(uuid=validated_data['sub'])
 
-        max_pos = LinkedStep.objects.filter(super=super) \
-                                    .aggregate(Max('pos'))['pos__max']
-        new_pos = 0 if max_pos is None else max_pos + 1
-        linked_step = LinkedStep.objects.create(super=super,
-                                                sub=sub,
-                                                pos=new_pos)
+        StepClosure.lock()
+        if has_circular_reference(super, sub):
+            raise CircularReference
+
+        linked_step = LinkedStep(super=super, sub=sub)
+        linked_step.pos = LinkedStep.objects.filter(super=super).count()
+        linked_step.save()
 
         if super.type != StepChoices.SEQUENCE:
             super.update_type(StepChoices.SUPER)
 
         return linked_step
+
+
+class LinkStepsSerializer(Serializer):
+    subs = ListField(child=UUIDField(), allow_empty=False, write_only=True)
+    pos = IntegerField(min_value=0, required=False, write_only=True)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        super = Step.objects.get(uuid=self.context['uuid'])
+        steps = {step.uuid: step for step in
+                 Step.objects.filter(uuid__in=validated_data['subs'])}
+        if len(steps) != len(set(validated_data['subs'])):
+            raise StepsNotFound
+        subs = [steps[uuid] for uuid in validated_data['subs']]
+
+        StepClosure.lock()
+        if has_circular_reference(super, *subs):
+            raise CircularReference
+
+        linked_steps = LinkedStep.bulk_link(super,
+                                            subs,
+                                            validated_data.get('pos'))
+
+        if super.type not in [StepChoices.SEQUENCE, StepChoices.SUPER]:
+            super.update_type(StepChoices.SUPER)
+
+        return linked_steps
+
+
+class OrderLinkedStepsSerializer(Serializer):
+    order = ListField(child=UUIDField(), write_only=True)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        super = Step.objects.get(uuid=self.context['uuid'])
+        linked_steps = LinkedStep.locked_below(super.pk) \
+                                 .select_related('sub')
+
+        # The same step can be linked more than once, these keep their
+        # relative order
+        by_sub = {}
+        for linked_step in linked_steps:
+            by_sub.setdefault(linked_step.sub.uuid, []).append(linked_step)
+
+        ordered = []
+        for uuid in validated_data['order']:
+            if not by_sub.get(uuid):
+                raise NotAValidOrder
+            ordered.append(by_sub[uuid].pop(0))
+        if len(ordered) != len(linked_steps):
+            raise NotAValidOrder
+
+        if ordered:
+            LinkedStep.reorder(super.pk, ordered)
+        return ordered
@@ -0,0 +1,115 @@
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.models.content import Explanation, Module, StepModule
+from api.models.step import LinkedStep
+
+
+@pytest.fixture
+def published_sequence(sequence, make_linked_steps):
+    make_linked_steps(super=sequence.step, sub=3)
+    return sequence.publish()
+
+
+def assert_reads_published_rows(queries):
+    assert len(queries) == 1
+    assert '"api_step"' not in queries[0]['sql']
+    assert '"api_linkedstep"' not in queries[0]['sql']
+
+
+@pytest.mark.django_db
+def test_guide_list_shows_latest_publications(client, published_sequence):
+    latest = published_sequence.sequence.publish()
+
+    url = reverse('api:guide-list')
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [i['uuid'] for i in response.data] == [str(latest.uuid)]
+    assert 'max-age=60' in response['Cache-Control']
+    assert_reads_published_rows(queries)
+
+
+@pytest.mark.django_db
+def test_get_guide(client, published_sequence):
+    kwargs = {'uuid': published_sequence.uuid}
+    url = reverse('api:guide', kwargs=kwargs)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['first'] == str(published_sequence.first)
+    assert 'immutable' in response['Cache-Control']
+    assert_reads_published_rows(queries)
+
+
+@pytest.mark.django_db
+def test_follow_guide_steps(client, published_sequence):
+    uuid = published_sequence.first
+    titles = []
+    previous = None
+    while uuid:
+        url = reverse('api:guide-step', kwargs={'uuid': uuid})
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['previous'] == previous
+        assert response.data['sequence'] == str(published_sequence.uuid)
+        assert 'immutable' in response['Cache-Control']
+        assert_reads_published_rows(queries)
+
+        titles.append(response.data['title'])
+        previous = response.data['uuid']
+        uuid = response.data['next']
+
+    assert len(titles) == 3
+
+
+@pytest.mark.django_db
+def test_get_unknown_guide_step(client, published_sequence):
+    kwargs = {'uuid': published_sequence.uuid}
+    url = reverse('api:guide-step', kwargs=kwargs)
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_guide_step_shows_module_content(client, settings, sequence,
+                                         make_step, make_image):
+    step = make_step()
+    LinkedStep.objects.create(super=sequence.step, sub=step)
+    image = make_image()
+    modules = [
+        Module.objects.create(explanation=Explanation.objects.create(
+            type='text', content='Second')),
+        Module.objects.create(image=image),
+        Module.objects.create(explanation=Explanation.objects.create(
+            type='code', content='First')),
+    ]
+    for pos, module in zip([2, 3, 1], modules):
+        StepModule.objects.create(step=step, module=module, pos=pos)
+    published_sequence = sequence.publish()
+
+    url = reverse('api:guide-step',
+                  kwargs={'uuid': published_sequence.first})
+    response = client.get(url)
+
+    assert response.data['content'] == 'First\n\nSecond\n\n/media/image.png'
+    # Signed image urls expire, the response can not be cached for long
+    assert 'immutable' not in response['Cache-Control']
+    assert f'max-age={settings.IMAGE_URL_CACHE_TIMEOUT}' in \
+        response['Cache-Control']
+
+    # Image urls are cached as well
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url)
+    assert_reads_published_rows(queries)
@@ -1,10 +1,17 @@
 import pytest
 
+import io
+import threading
+import uuid
+from importlib import import_module
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
 from django.urls import reverse
 from rest_framework import status
 
 from api.base.choices import StepChoices
-from api.models.step import LinkedStep
+from api.models.step import LinkedStep, StepClosure
 
 
 @pytest.mark.django_db
@@ -71,11 +78,10 @@ def test_delete_linked_step_updates_order(client, delete_index, step,
     payload = {'sub': linked_steps[delete_index].sub.uuid}
     client.delete(url, payload)
 
-    stored_linked_steps = LinkedStep.objects.filter(super=step).order_by('pos')
+    stored_linked_steps = step.linked_step_super.order_by('rank')
 
-    assert len(stored_linked_steps) == 2
-    assert stored_linked_steps[0].pos == 0
-    assert stored_linked_steps[1].pos == 1
+    assert list(stored_linked_steps) == \
+        [i for i in linked_steps if i != linked_steps[delete_index]]
 
 
 @pytest.mark.django_db
@@ -119,13 +125,47 @@ def test_rearrange_linked_steps(client, order, expected, step,
 
     assert response.status_code == status.HTTP_200_OK
 
-    stored_linked_steps = LinkedStep.objects.filter(super=step).order_by('pos')
+    stored_linked_steps = step.linked_step_super.order_by('rank')
 
     assert stored_linked_steps[0] == linked_steps[expected[0]]
     assert stored_linked_steps[1] == linked_steps[expected[1]]
     assert stored_linked_steps[2] == linked_steps[expected[2]]
 
 
+@pytest.mark.django_db
+def test_rearrange_linked_steps_writes_moved_step_only(client, step,
+                                                       make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=4)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:linked-step-order', kwargs=kwargs)
+
+    payload = {'from_index': 3, 'to_index': 1}
+    client.post(url, payload)
+
+    stored_linked_steps = step.linked_step_super.order_by('rank')
+    assert list(stored_linked_steps) == \
+        [linked_steps[i] for i in (0, 3, 1, 2)]
+    assert [i.rank for i in stored_linked_steps if i != linked_steps[3]] == \
+        [linked_steps[i].rank for i in (0, 1, 2)]
+
+
+@pytest.mark.django_db
+def test_rebalance_linked_steps(step, make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=3)
+    for _ in range(40):
+        step.linked_step_super.order_by('rank')[2].move(1)
+
+    ranks = step.linked_step_super.values_list('rank', flat=True)
+    assert max(len(rank) for rank in ranks) > 4
+
+    call_command('rebalance_linked_steps', '--max-length=4',
+                 stdout=io.StringIO())
+
+    assert list(step.linked_step_super.order_by('rank')) == linked_steps
+    assert max(len(rank) for rank in ranks.all()) == 1
+
+
 @pytest.mark.django_db
 def test_link_step_updates_super_step_type(client, make_step,
                                            make_linked_steps):
@@ -257,3 +297,395 @@ def test_link_step_to_sequence_does_not_change_type(client,
 
     sequence.refresh_from_db()
     assert sequence.step.type == StepChoices.SEQUENCE
+
+
+@pytest.mark.django_db
+def test_list_linkable_steps_excludes_all_parents(client, make_step):
+    # parent0      parent1
+    # L middle0    L middle1
+    #   L child      L child
+    #                  L can not link any parent
+
+    child = make_step()
+    for _ in range(2):
+        middle = make_step()
+        LinkedStep.objects.create(super=middle, sub=child)
+        LinkedStep.objects.create(super=make_step(), sub=middle)
+    linkable_step = make_step()
+
+    kwargs = {'uuid': child.uuid}
+    url = reverse('api:step-linkable', kwargs=kwargs)
+
+    response = client.get(url)
+    assert len(response.data['results']) == 1
+    assert response.data['results'][0]['uuid'] == str(linkable_step.uuid)
+
+
+@pytest.mark.django_db
+def test_link_step_to_itself_raises_error(client, step):
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    payload = {'sub': step.uuid}
+    response = client.post(url, payload)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not LinkedStep.objects.filter(super=step).exists()
+
+
+@pytest.mark.django_db
+def test_link_ancestor_raises_error(client, step, make_linked_steps):
+    # step
+    # L child
+    #   L grandchild
+    #     L can not link step
+
+    child = make_linked_steps(super=step, sub=1)[0].sub
+    grandchild = make_linked_steps(super=child, sub=1)[0].sub
+
+    kwargs = {'uuid': grandchild.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    payload = {'sub': step.uuid}
+    response = client.post(url, payload)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    msg = 'Linking this step would create a circular reference'
+    assert str(response.data['detail']) == msg
+
+
+@pytest.mark.django_db
+def test_delete_linked_step_keeps_other_paths(client, make_step):
+    # top
+    # L left    L right
+    #   L bottom  L bottom
+
+    top, left, right, bottom = [make_step() for _ in range(4)]
+    LinkedStep.objects.create(super=top, sub=left)
+    LinkedStep.objects.create(super=top, sub=right)
+    LinkedStep.objects.create(super=left, sub=bottom)
+    LinkedStep.objects.create(super=right, sub=bottom)
+
+    url = reverse('api:linked-step-delete', kwargs={'uuid': left.uuid})
+    client.delete(url, {'sub': bottom.uuid})
+
+    assert set(bottom.ancestors()) == {top, right}
+
+    url = reverse('api:linked-step-delete', kwargs={'uuid': right.uuid})
+    client.delete(url, {'sub': bottom.uuid})
+
+    assert not bottom.ancestors().exists()
+    assert set(top.descendants()) == {left, right}
+
+
+@pytest.mark.django_db
+def test_delete_step_unlinks_it_from_the_graph(client, step,
+                                               make_linked_steps):
+    # step
+    # L child
+    #   L grandchild
+
+    child = make_linked_steps(super=step, sub=1)[0].sub
+    grandchild = make_linked_steps(super=child, sub=1)[0].sub
+
+    url = reverse('api:step', kwargs={'uuid': child.uuid})
+    client.delete(url)
+
+    assert not grandchild.ancestors().exists()
+    assert not step.descendants().exists()
+
+    kwargs = {'uuid': grandchild.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    response = client.post(url, {'sub': step.uuid})
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+def test_link_many_steps(client, step, make_step):
+    subs = [make_step() for _ in range(3)]
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    payload = {'subs': [str(sub.uuid) for sub in subs]}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [i['sub'] for i in response.data] == payload['subs']
+    assert [i['pos'] for i in response.data] == [0, 1, 2]
+
+    step.refresh_from_db()
+    assert step.type == StepChoices.SUPER
+    assert set(step.descendants()) == set(subs)
+
+
+@pytest.mark.django_db
+def test_link_many_steps_at_position(client, step, make_step,
+                                     make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=2)
+    subs = [make_step() for _ in range(2)]
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    payload = {'subs': [str(sub.uuid) for sub in subs], 'pos': 1}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+
+    stored_linked_steps = step.linked_step_super.order_by('rank')
+    assert [i.sub for i in stored_linked_steps] == \
+        [linked_steps[0].sub, subs[0], subs[1], linked_steps[1].sub]
+    assert [i['pos'] for i in response.data] == [1, 2]
+
+    # Only the new linked steps are written
+    for linked_step in linked_steps:
+        rank = linked_step.rank
+        linked_step.refresh_from_db()
+        assert linked_step.rank == rank
+
+
+@pytest.mark.django_db
+def test_link_many_steps_rejects_unknown_steps(client, step, make_step):
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    payload = {'subs': [str(make_step().uuid), str(uuid.uuid4())]}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not LinkedStep.objects.filter(super=step).exists()
+
+
+@pytest.mark.django_db
+def test_link_many_steps_rejects_circular_reference(client, step, make_step,
+                                                    make_linked_steps):
+    child = make_linked_steps(super=step, sub=1)[0].sub
+
+    kwargs = {'uuid': child.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+
+    payload = {'subs': [str(make_step().uuid), str(step.uuid)]}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not LinkedStep.objects.filter(super=child).exists()
+
+
+@pytest.mark.django_db
+def test_link_many_steps_query_count_is_constant(client,
+                                                 django_assert_num_queries,
+                                                 make_step):
+    step = make_step()
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step-link', kwargs=kwargs)
+    client.post(url, {'subs': [str(make_step().uuid)]}, format='json')
+
+    for count in [1, 20]:
+        payload = {'subs': [str(make_step().uuid) for _ in range(count)]}
+        with django_assert_num_queries(18):
+            client.post(url, payload, format='json')
+
+
+@pytest.mark.django_db
+def test_rearrange_linked_steps_with_full_order(client, step,
+                                                make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=4)
+    expected = [linked_steps[i] for i in (2, 0, 3, 1)]
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:linked-step-order', kwargs=kwargs)
+
+    payload = {'order': [str(i.sub.uuid) for i in expected]}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_200_OK
+
+    stored_linked_steps = step.linked_step_super.order_by('rank')
+    assert list(stored_linked_steps) == expected
+
+
+@pytest.mark.django_db
+def test_rearrange_linked_steps_with_repeated_step(client, step,
+                                                   make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=2)
+    repeated = LinkedStep.objects.create(super=step, sub=linked_steps[0].sub)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:linked-step-order', kwargs=kwargs)
+
+    sub_uuids = [str(linked_steps[0].sub.uuid), str(linked_steps[1].sub.uuid)]
+    payload = {'order': [sub_uuids[1], sub_uuids[0], sub_uuids[0]]}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_200_OK
+
+    stored_linked_steps = step.linked_step_super.order_by('rank')
+    assert list(stored_linked_steps) == \
+        [linked_steps[1], linked_steps[0], repeated]
+
+
+@pytest.mark.parametrize('order',
+                         [(0, 1),
+                          (0, 1, 2, 2),
+                          (0, 1, 1)])
+@pytest.mark.django_db
+def test_rearrange_linked_steps_rejects_invalid_order(client, order, step,
+                                                      make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=3)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:linked-step-order', kwargs=kwargs)
+
+    payload = {'order': [str(linked_steps[i].sub.uuid) for i in order]}
+    response = client.post(url, payload, format='json')
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    stored_linked_steps = step.linked_step_super.order_by('rank')
+    assert list(stored_linked_steps) == linked_steps
+
+
+def backfill_closure():
+    migration = import_module('api.migrations.0007_stepclosure')
+    StepClosure.objects.all().delete()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(migration.BACKFILL_SQL)
+    return set(StepClosure.objects.values_list('ancestor', 'descendant',
+                                               'depth', 'paths'))
+
+
+@pytest.mark.django_db
+def test_closure_migration_counts_shared_paths(make_step):
+    top, left, right, shared, bottom = (make_step() for _ in range(5))
+    for super, sub in [(top, left), (top, right), (top, left),
+                       (left, shared), (right, shared), (shared, bottom)]:
+        LinkedStep.objects.create(super=super, sub=sub)
+    maintained = set(StepClosure.objects.values_list(
+        'ancestor', 'descendant', 'depth', 'paths'))
+
+    assert backfill_closure() == maintained
+    assert (top.pk, bottom.pk, 3, 3) in maintained
+
+
+@pytest.mark.django_db
+def test_closure_migration_rejects_cyclic_links(make_step):
+    steps = [make_step() for _ in range(3)]
+    for super, sub in zip(steps, steps[1:]):
+        LinkedStep.objects.create(super=super, sub=sub)
+
+    # Links predating the cycle check can close a cycle
+    LinkedStep.objects.bulk_create([
+        LinkedStep(super=steps[2], sub=steps[0], rank='a')])
+    with pytest.raises(DatabaseError, match='cycle through step id'):
+        backfill_closure()
+
+
+def in_thread(func, errors):
+    """
+    Runs func on its own database connection, collecting its exception.
+    """
+    def run():
+        try:
+            func()
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_link_and_unlink_keep_closure_exact(make_step):
+    top, middle, bottom = (make_step() for _ in range(3))
+    unlinked = LinkedStep.objects.create(super=middle, sub=bottom)
+    linked, commit = threading.Event(), threading.Event()
+    errors = []
+
+    def link():
+        with transaction.atomic():
+            LinkedStep.objects.create(super=top, sub=middle)
+            linked.set()
+            commit.wait(5)
+
+    linking = in_thread(link, errors)
+    assert linked.wait(5)
+    unlinking = in_thread(unlinked.delete, errors)
+
+    # The unlink waits for the link, and then sees its closure rows
+    unlinking.join(0.5)
+    assert unlinking.is_alive()
+    commit.set()
+    linking.join(5)
+    unlinking.join(5)
+
+    assert errors == []
+    assert not top.descendants().filter(pk=bottom.pk).exists()
+    assert not StepClosure.objects.filter(ancestor=top,
+                                          descendant=bottom).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_link_waits_for_concurrent_reorder(step, make_linked_steps,
+                                           make_step):
+    make_linked_steps(step, 3)
+    new = make_step()
+    reordered, commit = threading.Event(), threading.Event()
+    errors = []
+
+    def reorder():
+        with transaction.atomic():
+            linked_steps = list(LinkedStep.locked_below(step.pk))
+            LinkedStep.reorder(step.pk, linked_steps[::-1])
+            reordered.set()
+            commit.wait(5)
+
+    reordering = in_thread(reorder, errors)
+    assert reordered.wait(5)
+    linking = in_thread(
+        lambda: LinkedStep.objects.create(super=step, sub=new), errors)
+
+    # The link allocates its rank from the new order
+    linking.join(0.5)
+    assert linking.is_alive()
+    commit.set()
+    reordering.join(5)
+    linking.join(5)
+
+    assert errors == []
+    assert step.linked[-1] == new
+
+
+@pytest.mark.django_db(transaction=True)
+def test_link_to_super_step_during_move_below_it(make_step,
+                                                 make_linked_steps):
+    top, super = make_step(), make_step()
+    make_linked_steps(super, 2)
+    moved = LinkedStep.objects.filter(super=super).order_by('rank').last()
+    linked, commit = threading.Event(), threading.Event()
+    errors = []
+
+    def link():
+        with transaction.atomic():
+            LinkedStep.objects.create(super=top, sub=super)
+            linked.set()
+            commit.wait(5)
+
+    linking = in_thread(link, errors)
+    assert linked.wait(5)
+    # The move locks super and then waits for the link to commit, whose
+    # foreign key check needs a share lock on super
+    moving = in_thread(lambda: moved.move(0), errors)
+    moving.join(0.5)
+    commit.set()
+    linking.join(5)
+    moving.join(5)
+
+    assert errors == []
+    assert super.linked[0] == moved.sub
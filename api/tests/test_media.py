@@ -0,0 +1,611 @@
+import pytest
+
+import threading
+import uuid
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework import status
+
+from api.functions import image_variants, storage_deletion
+from api.functions.image_uploads import read_upload_token, upload_token
+from api.functions.image_variants import generate_variants
+from api.functions.media_urls import expand_image_placeholders
+from api.models.content import Image, ImageBlob
+from api.serializers.media_serializers import ImageSerializer
+from api.views import media_views
+
+
+@pytest.fixture
+def storage_urls():
+    url = FileSystemStorage.url
+    with mock.patch.object(FileSystemStorage, 'url', autospec=True,
+                           side_effect=url) as storage_url:
+        yield storage_url
+
+
+@pytest.mark.django_db
+def test_expand_image_placeholders(django_assert_num_queries, make_image,
+                                   storage_urls):
+    images = [make_image(f'{i}.png') for i in range(3)]
+    unknown = uuid.uuid4()
+    content = ' '.join(f'[[img|{i.uuid}]]' for i in images + images) + \
+        f' [[img|{unknown}]]'
+
+    with django_assert_num_queries(1):
+        expanded = expand_image_placeholders(content)
+
+    assert expanded == ' '.join(f'/media/{i}.png' for i in [0, 1, 2] * 2) + \
+        f' [[img|{unknown}]]'
+    assert storage_urls.call_count == 3
+
+    # Only the unknown image is looked up again
+    with django_assert_num_queries(1):
+        assert expand_image_placeholders(content) == expanded
+    assert storage_urls.call_count == 3
+
+
+@pytest.mark.django_db
+def test_expand_content_without_placeholders(django_assert_num_queries):
+    with django_assert_num_queries(0):
+        assert expand_image_placeholders('[[img|abc]]') == '[[img|abc]]'
+
+
+@pytest.mark.django_db
+def test_image_serializer_shares_url_cache(rf, make_image, storage_urls):
+    image = make_image()
+    expand_image_placeholders(f'[[img|{image.uuid}]]')
+
+    context = {'request': rf.get('/')}
+    data = ImageSerializer(image, context=context).data
+
+    assert data['image'] == '/media/image.png'
+    assert storage_urls.call_count == 1
+
+
+@pytest.mark.django_db
+def test_saving_image_invalidates_url(make_image):
+    image = make_image()
+    assert image.url == '/media/image.png'
+
+    image.image = 'other.png'
+    image.save()
+
+    assert image.url == '/media/other.png'
+
+
+@pytest.mark.django_db
+def test_get_image(client, make_image):
+    image = make_image()
+
+    kwargs = {'uuid': image.uuid}
+    url = reverse('api:image', kwargs=kwargs)
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['uuid'] == str(image.uuid)
+    assert response.data['image'] == '/media/image.png'
+
+
+def png(width, height):
+    buffer = BytesIO()
+    PILImage.new('RGB', (width, height), 'red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def photo(media_storage):
+    image = Image(title='photo.png')
+    image.image.save('photo.png', ContentFile(png(2000, 1000)))
+    return image
+
+
+@pytest.mark.django_db
+def test_generate_variants(photo, media_storage):
+    generate_variants(photo)
+
+    photo.refresh_from_db()
+    sizes = {(i['width'], i['format']) for i in photo.variants}
+    assert sizes == {(width, format)
+                     for width in [160, 640, 1280, 2000]
+                     for format in ['png', 'webp']}
+    for variant in photo.variants:
+        with PILImage.open(media_storage / variant['name']) as file:
+            assert file.size == (variant['width'], variant['height'])
+
+
+@pytest.mark.django_db
+def test_failed_variants_are_logged(caplog, media_storage):
+    image = Image(title='broken.png')
+    image.image.save('broken.png', ContentFile(b'not an image'))
+
+    # Closing connections is for the worker threads, not the test
+    with mock.patch.object(image_variants, 'close_old_connections'):
+        image_variants._generate_variants(image.pk)
+
+    assert f'variants of image {image.pk} failed' in caplog.text
+    image.refresh_from_db()
+    assert image.variants == []
+
+
+@pytest.mark.parametrize('width, webp, expected',
+                         [(200, False, 'photo-medium.png'),
+                          (200, True, 'photo-medium.webp'),
+                          (None, False, 'photo.png'),
+                          (None, True, 'photo.webp'),
+                          (5000, False, 'photo.png'),
+                          (160, True, 'photo-thumbnail.webp')])
+@pytest.mark.django_db
+def test_image_variant(photo, width, webp, expected):
+    assert photo.variant(width, webp) == 'photo.png'
+
+    generate_variants(photo)
+    assert photo.variant(width, webp) == expected
+
+
+@pytest.mark.django_db
+def test_render_image_variant(client, photo):
+    generate_variants(photo)
+
+    kwargs = {'uuid': photo.uuid}
+    url = reverse('api:image-render', kwargs=kwargs)
+
+    response = client.get(url, {'w': 600}, HTTP_ACCEPT='image/webp,*/*')
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'] == 'image/webp'
+    with PILImage.open(BytesIO(b''.join(response.streaming_content))) as file:
+        assert file.size == (640, 320)
+
+
+@pytest.mark.django_db
+def test_upload_image_schedules_variants(client, media_storage,
+                                         django_capture_on_commit_callbacks):
+    upload = ContentFile(png(400, 300), name='upload.png')
+    url = reverse('api:image-list')
+
+    with mock.patch.object(image_variants, '_executor') as executor, \
+            django_capture_on_commit_callbacks(execute=True):
+        response = client.post(url, {'image': upload})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    image = Image.objects.get(uuid=response.data['uuid'])
+    executor.submit.assert_called_once_with(
+        image_variants._generate_variants, image.pk)
+
+
+@pytest.mark.django_db
+def test_render_image_streams_whole_file(client, photo):
+    kwargs = {'uuid': photo.uuid}
+    url = reverse('api:image-render', kwargs=kwargs)
+
+    response = client.get(url)
+    content = b''.join(response.streaming_content)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert content == photo.image.open('rb').read()
+    assert response['Content-Length'] == str(len(content))
+    assert response['Accept-Ranges'] == 'bytes'
+    assert 'max-age=86400' in response['Cache-Control']
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.parametrize('header, expected',
+                         [('bytes=0-9', (0, 9)),
+                          ('bytes=10-', (10, None)),
+                          ('bytes=-5', (-5, None)),
+                          ('bytes=5-100000000', (5, None))])
+@pytest.mark.django_db
+def test_render_image_range(client, photo, header, expected):
+    data = photo.image.open('rb').read()
+    start, end = expected
+    expected_content = data[start:end + 1 if end is not None else None]
+
+    kwargs = {'uuid': photo.uuid}
+    url = reverse('api:image-render', kwargs=kwargs)
+
+    response = client.get(url, HTTP_RANGE=header)
+    content = b''.join(response.streaming_content)
+
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert content == expected_content
+    assert response['Content-Length'] == str(len(expected_content))
+    assert response['Content-Range'].endswith(f'/{len(data)}')
+
+
+@pytest.mark.django_db
+def test_render_image_rejects_unsatisfiable_range(client, photo):
+    kwargs = {'uuid': photo.uuid}
+    url = reverse('api:image-render', kwargs=kwargs)
+
+    response = client.get(url, HTTP_RANGE='bytes=100000000-')
+    assert response.status_code == \
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+@pytest.mark.django_db
+def test_render_image_ignores_range_for_changed_file(client, photo):
+    kwargs = {'uuid': photo.uuid}
+    url = reverse('api:image-render', kwargs=kwargs)
+
+    response = client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_render_image_redirects_to_storage(client, settings, photo,
+                                           storage_urls):
+    settings.IMAGE_RENDER_MODE = 'redirect'
+
+    kwargs = {'uuid': photo.uuid}
+    url = reverse('api:image-render', kwargs=kwargs)
+
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response['Location'] == '/media/photo.png'
+    assert storage_urls.call_count == 1
+
+    settings.IMAGE_CDN_URL = 'https://cdn.example.com'
+    response = client.get(url)
+    assert response['Location'] == 'https://cdn.example.com/photo.png'
+
+
+@pytest.mark.django_db
+def test_start_image_upload(client, s3):
+    url = reverse('api:image-upload')
+    data = {'filename': 'Photo.PNG', 'content_type': 'image/png',
+            'size': 1000}
+
+    response = client.post(url, data)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['method'] == 'POST'
+    assert response.data['name'] == f'{response.data["uuid"]}.png'
+    fields = response.data['fields']
+    assert fields['key'] == f'sequence/api/media/{response.data["name"]}'
+    assert fields['Content-Type'] == 'image/png'
+    assert 'policy' in fields
+    assert read_upload_token(response.data['token']) == {
+        'uuid': str(response.data['uuid']),
+        'name': response.data['name'],
+        'upload_id': None}
+
+
+@pytest.mark.django_db
+def test_start_multipart_image_upload(client, settings, s3):
+    settings.IMAGE_UPLOAD_PART_SIZE = 5 * 1024 * 1024
+    s3.add_response('create_multipart_upload', {'UploadId': 'upload-1'})
+
+    url = reverse('api:image-upload')
+    data = {'filename': 'photo.jpg', 'content_type': 'image/jpeg',
+            'size': 12 * 1024 * 1024}
+    response = client.post(url, data)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['method'] == 'PUT'
+    assert response.data['upload_id'] == 'upload-1'
+    parts = response.data['parts']
+    assert [part['part_number'] for part in parts] == [1, 2, 3]
+    assert 'partNumber=3' in parts[2]['url']
+    upload = read_upload_token(response.data['token'])
+    assert upload['upload_id'] == 'upload-1'
+
+
+@pytest.mark.parametrize('data',
+                         [{'filename': 'notes.txt',
+                           'content_type': 'image/png',
+                           'size': 10},
+                          {'filename': 'photo.png',
+                           'content_type': 'text/plain',
+                           'size': 10},
+                          {'filename': 'photo.png',
+                           'content_type': 'image/png',
+                           'size': 100 * 1024 * 1024}])
+@pytest.mark.django_db
+def test_start_image_upload_rejects_files(client, s3, data):
+    url = reverse('api:image-upload')
+    response = client.post(url, data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_start_image_upload_requires_s3(client, media_storage):
+    url = reverse('api:image-upload')
+    data = {'filename': 'photo.png', 'content_type': 'image/png',
+            'size': 10}
+    response = client.post(url, data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_finalize_image_upload(client, s3):
+    image_uuid = uuid.uuid4()
+    name = f'{image_uuid}.png'
+    s3.add_response('head_object',
+                    {'ContentType': 'image/png', 'ContentLength': 1000},
+                    {'Bucket': 'tiverspace',
+                     'Key': f'sequence/api/media/{name}'})
+
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    token = upload_token(image_uuid, name)
+    response = client.post(url, {'token': token, 'title': 'Photo'})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    image = Image.objects.get(uuid=image_uuid)
+    assert image.image.name == name
+    assert image.title == 'Photo'
+
+    response = client.post(url, {'token': token})
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+
+@pytest.mark.django_db
+def test_finalize_multipart_image_upload(client, s3):
+    image_uuid = uuid.uuid4()
+    name = f'{image_uuid}.png'
+    key = f'sequence/api/media/{name}'
+    s3.add_response('complete_multipart_upload', {},
+                    {'Bucket': 'tiverspace',
+                     'Key': key,
+                     'UploadId': 'upload-1',
+                     'MultipartUpload': {'Parts': [
+                         {'PartNumber': 1, 'ETag': '"a"'},
+                         {'PartNumber': 2, 'ETag': '"b"'}]}})
+    s3.add_response('head_object',
+                    {'ContentType': 'image/png', 'ContentLength': 1000})
+
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    data = {'token': upload_token(image_uuid, name, 'upload-1'),
+            'parts': [{'part_number': 1, 'etag': '"a"'},
+                      {'part_number': 2, 'etag': '"b"'}]}
+    response = client.post(url, data, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Image.objects.filter(uuid=image_uuid).exists()
+
+
+@pytest.mark.django_db
+def test_finalize_missing_image_upload(client, s3):
+    image_uuid = uuid.uuid4()
+    s3.add_client_error('head_object', service_error_code='404',
+                        http_status_code=404)
+
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    token = upload_token(image_uuid, f'{image_uuid}.png')
+    response = client.post(url, {'token': token})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Image.objects.exists()
+
+
+@pytest.mark.django_db
+def test_finalize_rejects_uploaded_non_image(
+        client, s3, django_capture_on_commit_callbacks):
+    image_uuid = uuid.uuid4()
+    key = f'sequence/api/media/{image_uuid}.png'
+    s3.add_response('head_object',
+                    {'ContentType': 'text/html', 'ContentLength': 10})
+    s3.add_response('delete_objects', {},
+                    {'Bucket': 'tiverspace',
+                     'Delete': {'Objects': [{'Key': key}], 'Quiet': True}})
+
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    with django_capture_on_commit_callbacks(execute=True):
+        token = upload_token(image_uuid, f'{image_uuid}.png')
+        response = client.post(url, {'token': token})
+    storage_deletion.flush()
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Image.objects.exists()
+
+
+@pytest.mark.parametrize('token',
+                         ['forged',
+                          signing.dumps({'uuid': 'x', 'name': 'x.png',
+                                         'upload_id': None}),
+                          upload_token(uuid.uuid4(), 'other.png')])
+@pytest.mark.django_db
+def test_finalize_requires_issued_upload_token(client, s3, token):
+    image_uuid = uuid.uuid4()
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    response = client.post(url, {'token': token})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'token' in response.data
+    assert not Image.objects.exists()
+
+
+@pytest.mark.django_db
+def test_finalize_rejects_expired_upload_token(client, s3, settings):
+    image_uuid = uuid.uuid4()
+    token = upload_token(image_uuid, f'{image_uuid}.png')
+    settings.IMAGE_UPLOAD_FINALIZE_EXPIRE = -1
+
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    response = client.post(url, {'token': token})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_finalize_rejects_shared_blob_file(client, s3):
+    blob = ImageBlob.objects.create(sha256='a' * 64, name='shared.png',
+                                    size=10, references=1)
+    image_uuid = uuid.uuid4()
+    token = upload_token(image_uuid, blob.name)
+
+    url = reverse('api:image-upload-finalize', kwargs={'uuid': image_uuid})
+    response = client.post(url, {'token': token})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Image.objects.exists()
+
+
+@pytest.mark.django_db
+def test_abort_abandoned_image_uploads(s3):
+    now = timezone.now()
+    s3.add_response('list_multipart_uploads',
+                    {'Uploads': [
+                        {'Key': 'sequence/api/media/old.png',
+                         'UploadId': 'upload-1',
+                         'Initiated': now - timedelta(days=1)},
+                        {'Key': 'sequence/api/media/new.png',
+                         'UploadId': 'upload-2',
+                         'Initiated': now}]},
+                    {'Bucket': 'tiverspace',
+                     'Prefix': 'sequence/api/media/'})
+    s3.add_response('abort_multipart_upload', {},
+                    {'Bucket': 'tiverspace',
+                     'Key': 'sequence/api/media/old.png',
+                     'UploadId': 'upload-1'})
+
+    out = StringIO()
+    call_command('abort_image_uploads', stdout=out)
+
+    s3.assert_no_pending_responses()
+    assert 'Aborted 1 abandoned uploads' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_upload_reuses_stored_content(client, media_storage,
+                                      django_capture_on_commit_callbacks):
+    url = reverse('api:image-list')
+    content = png(40, 30)
+
+    uuids = []
+    for name in ['logo.png', 'logo-copy.png']:
+        response = client.post(url, {'image': ContentFile(content, name)})
+        assert response.status_code == status.HTTP_201_CREATED
+        uuids.append(response.data['uuid'])
+    client.post(url, {'image': ContentFile(png(30, 40), 'other.png')})
+
+    first, second = (Image.objects.get(uuid=i) for i in uuids)
+    assert first.blob == second.blob
+    assert first.image.name == second.image.name
+    assert first.blob.references == 2
+    assert second.title == 'logo-copy.png'
+    assert ImageBlob.objects.count() == 2
+    assert len(list(media_storage.iterdir())) == 2
+
+    with django_capture_on_commit_callbacks(execute=True):
+        first.delete()
+    assert (media_storage / second.image.name).exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        second.delete()
+    assert not (media_storage / second.image.name).exists()
+    assert ImageBlob.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_upload_shares_variants(client, media_storage):
+    url = reverse('api:image-list')
+    content = png(400, 300)
+
+    response = client.post(url, {'image': ContentFile(content, 'a.png')})
+    first = Image.objects.get(uuid=response.data['uuid'])
+    generate_variants(first)
+
+    with mock.patch.object(media_views, 'schedule_variants') as schedule:
+        response = client.post(url, {'image': ContentFile(content, 'b.png')})
+
+    second = Image.objects.get(uuid=response.data['uuid'])
+    assert second.variants == first.variants
+    schedule.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_upload_schedules_variants_once_per_blob(client, media_storage):
+    url = reverse('api:image-list')
+    content = png(400, 300)
+
+    with mock.patch.object(media_views, 'schedule_variants') as schedule:
+        response = client.post(url, {'image': ContentFile(content, 'a.png')})
+        # The variants of the first upload are not generated yet
+        client.post(url, {'image': ContentFile(content, 'b.png')})
+
+    first = Image.objects.get(uuid=response.data['uuid'])
+    schedule.assert_called_once_with(first)
+
+    generate_variants(first)
+    assert all(image.variants == first.variants
+               for image in Image.objects.all())
+    assert ImageBlob.objects.get().variants == first.variants
+
+
+@pytest.mark.django_db(transaction=True)
+def test_variants_reach_upload_committed_during_generation(media_storage):
+    blob = ImageBlob.objects.create(sha256='a' * 64, name='photo.png',
+                                    size=10, references=1)
+    (media_storage / blob.name).write_bytes(png(400, 300))
+    first = Image.objects.create(image=blob.name, blob=blob)
+    uploaded, commit = threading.Event(), threading.Event()
+
+    def upload():
+        # What the upload view does for content that is already stored
+        try:
+            with transaction.atomic():
+                blob, _ = ImageBlob.acquire('a' * 64, None)
+                Image.objects.create(image=blob.name, blob=blob,
+                                     variants=blob.variants)
+                uploaded.set()
+                commit.wait(5)
+        finally:
+            connection.close()
+
+    def generate():
+        try:
+            generate_variants(first)
+        finally:
+            connection.close()
+
+    uploading = threading.Thread(target=upload)
+    uploading.start()
+    assert uploaded.wait(5)
+    generating = threading.Thread(target=generate)
+    generating.start()
+
+    # Generating waits for the upload to commit, then includes its image
+    generating.join(0.5)
+    assert generating.is_alive()
+    commit.set()
+    uploading.join(5)
+    generating.join(5)
+
+    assert first.variants
+    assert all(image.variants == first.variants
+               for image in Image.objects.all())
+    assert Image.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_variants_migration_copies_image_variants(make_image):
+    migration = import_module('api.migrations.0019_imageblob_variants')
+    variants = [{'name': 'shared.png', 'width': 10, 'height': 10,
+                 'format': 'png'}]
+    blob = ImageBlob.objects.create(sha256='a' * 64, name='shared.png',
+                                    size=10, references=2)
+    pending = ImageBlob.objects.create(sha256='b' * 64, name='new.png',
+                                       size=10, references=1)
+    Image.objects.create(image=blob.name, blob=blob)
+    Image.objects.create(image=blob.name, blob=blob, variants=variants)
+    Image.objects.create(image=pending.name, blob=pending)
+
+    with connection.cursor() as cursor:
+        cursor.execute(migration.BACKFILL_SQL)
+
+    blob.refresh_from_db()
+    pending.refresh_from_db()
+    assert blob.variants == variants
+    assert pending.variants == []
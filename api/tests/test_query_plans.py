@@ -0,0 +1,153 @@
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.functions.search import trigram_available
+from api.models.step import LinkedStep
+
+
+def seq_scans(plan):
+    """
+    Returns the relations read with a sequential scan anywhere in plan.
+    """
+    relations = []
+    if plan.get('Node Type') == 'Seq Scan':
+        relations.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        relations.extend(seq_scans(child))
+    return relations
+
+
+@pytest.fixture
+def assert_index_scans():
+    """
+    Runs EXPLAIN on every SELECT issued within the context and fails on
+    sequential scans. With sequential scans disabled the planner only falls
+    back to them when no index can answer the query, so the result does not
+    depend on the size of the test database.
+    """
+    class Context(CaptureQueriesContext):
+        def __exit__(self, *args):
+            super().__exit__(*args)
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                for query in self.captured_queries:
+                    if not query['sql'].startswith('SELECT'):
+                        continue
+                    cursor.execute(f'EXPLAIN (FORMAT JSON) {query["sql"]}')
+                    plan = cursor.fetchone()[0][0]['Plan']
+                    assert seq_scans(plan) == [], query['sql']
+
+    return lambda: Context(connection)
+
+
+@pytest.fixture
+def seeded_steps(sequence, make_step, make_linked_steps):
+    # Some unrelated rows, so lookups have to pick their row
+    for _ in range(3):
+        make_linked_steps(super=make_step(), sub=2)
+
+    children = make_linked_steps(super=sequence.step, sub=3)
+    make_linked_steps(super=children[0].sub, sub=2)
+    LinkedStep.graph()
+    return sequence
+
+
+@pytest.mark.django_db
+def test_get_step_uses_indexes(client, seeded_steps, assert_index_scans):
+    url = reverse('api:step', kwargs={'uuid': seeded_steps.step.uuid})
+
+    with assert_index_scans():
+        client.get(url)
+
+
+@pytest.mark.django_db
+def test_get_sequence_uses_indexes(client, seeded_steps, assert_index_scans):
+    url = reverse('api:sequence', kwargs={'uuid': seeded_steps.step.uuid})
+
+    with assert_index_scans():
+        client.get(url)
+    with assert_index_scans():
+        client.get(url)
+
+
+@pytest.mark.django_db
+def test_link_step_uses_indexes(client, seeded_steps, make_step,
+                                assert_index_scans):
+    url = reverse('api:step-link', kwargs={'uuid': seeded_steps.step.uuid})
+
+    with assert_index_scans():
+        client.post(url, {'sub': make_step().uuid})
+    with assert_index_scans():
+        client.post(url, {'subs': [str(make_step().uuid)], 'pos': 1},
+                    format='json')
+
+
+@pytest.mark.django_db
+def test_order_linked_steps_uses_indexes(client, seeded_steps,
+                                         assert_index_scans):
+    kwargs = {'uuid': seeded_steps.step.uuid}
+    url = reverse('api:linked-step-order', kwargs=kwargs)
+
+    with assert_index_scans():
+        client.post(url, {'from_index': 2, 'to_index': 0})
+
+
+@pytest.mark.django_db
+def test_delete_linked_step_uses_indexes(client, seeded_steps,
+                                         assert_index_scans):
+    kwargs = {'uuid': seeded_steps.step.uuid}
+    url = reverse('api:linked-step-delete', kwargs=kwargs)
+    sub = seeded_steps.step.linked_step_super.first().sub
+
+    with assert_index_scans():
+        client.delete(url, {'sub': sub.uuid})
+
+
+@pytest.mark.django_db
+def test_step_usage_uses_indexes(client, seeded_steps, assert_index_scans):
+    sub = seeded_steps.step.linked_step_super.first().sub
+    url = reverse('api:step-usage', kwargs={'uuid': sub.uuid})
+
+    with assert_index_scans():
+        client.get(url)
+
+
+@pytest.mark.django_db
+def test_guide_step_uses_indexes(client, seeded_steps, assert_index_scans):
+    published_sequence = seeded_steps.publish()
+    kwargs = {'uuid': published_sequence.first}
+    url = reverse('api:guide-step', kwargs=kwargs)
+
+    with assert_index_scans():
+        client.get(url)
+
+
+@pytest.mark.parametrize('ordering', ['-updated', 'title'])
+@pytest.mark.django_db
+def test_cursor_page_uses_indexes(client, make_step, assert_index_scans,
+                                  ordering):
+    for _ in range(25):
+        make_step()
+    url = reverse('api:step-list')
+    response = client.get(url, {'cursor': '', 'ordering': ordering})
+
+    with assert_index_scans():
+        response = client.get(response.data['next_url'])
+    assert len(response.data['results']) == 5
+
+
+@pytest.mark.parametrize('url, params',
+                         [('api:step-list', {'search': 'step'}),
+                          ('api:sequence-list', {'search': 'step'}),
+                          ('api:search', {'q': 'step'})])
+@pytest.mark.django_db
+def test_search_uses_indexes(client, seeded_steps, assert_index_scans,
+                             url, params):
+    trigram_available()
+
+    with assert_index_scans():
+        response = client.get(reverse(url), params)
+    assert response.status_code == 200
@@ -0,0 +1,62 @@
+import pytest
+
+import random
+
+from api.functions.ranks import balanced_ranks, rank_between, ranks_between
+
+
+@pytest.mark.parametrize('before, after',
+                         [(None, None),
+                          ('i', None),
+                          (None, 'i'),
+                          (None, '1'),
+                          ('i', 'j'),
+                          ('i', 'i01'),
+                          ('izz', 'j')])
+def test_rank_between(before, after):
+    rank = rank_between(before, after)
+
+    assert (before or '') < rank
+    assert after is None or rank < after
+    assert not rank.endswith('0')
+
+
+def test_rank_between_rejects_unordered_ranks():
+    with pytest.raises(ValueError):
+        rank_between('j', 'i')
+
+
+@pytest.mark.parametrize('before, after',
+                         [(None, None),
+                          ('i', None),
+                          (None, 'i'),
+                          ('i', 'j')])
+def test_ranks_between(before, after):
+    ranks = ranks_between(before, after, 50)
+
+    assert len(ranks) == 50
+    assert ranks == sorted(set(ranks))
+    assert (before or '') < ranks[0]
+    assert after is None or ranks[-1] < after
+
+
+def test_random_inserts_keep_ranks_short():
+    random.seed(0)
+    ranks = []
+    for _ in range(1000):
+        i = random.randint(0, len(ranks))
+        before = ranks[i - 1] if i > 0 else None
+        after = ranks[i] if i < len(ranks) else None
+        ranks.insert(i, rank_between(before, after))
+
+    assert ranks == sorted(set(ranks))
+    assert max(len(rank) for rank in ranks) <= 8
+
+
+def test_balanced_ranks():
+    assert balanced_ranks(1) == ['i']
+    assert len(balanced_ranks(35)[0]) == 1
+    assert len(balanced_ranks(36)[0]) == 2
+
+    ranks = balanced_ranks(1000)
+    assert ranks == sorted(set(ranks))
@@ -0,0 +1,101 @@
+import pytest
+
+import datetime
+import decimal
+import uuid
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
+
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from api.functions.custom_renderers import ORJSONRenderer
+from api.models.step import Step
+
+
+UUID = uuid.UUID('5e0d5f7a-2bc7-4b0a-9d57-2cbb4bf0b1a1')
+UTC = datetime.datetime(2022, 7, 1, 12, 30, 5, 120,
+                        tzinfo=datetime.timezone.utc)
+
+
+def sample():
+    return OrderedDict([
+        ('uuid', UUID),
+        ('utc', UTC),
+        ('local', datetime.datetime(2022, 7, 1, 12, 30,
+                                    tzinfo=ZoneInfo('Europe/Amsterdam'))),
+        ('naive', datetime.datetime(2022, 7, 1, 12, 30)),
+        ('date', datetime.date(2022, 7, 1)),
+        ('decimal', decimal.Decimal('1.5')),
+        ('duration', datetime.timedelta(minutes=1)),
+        ('lazy', gettext_lazy('Not found.')),
+        ('text', 'Ünïcode \u2028\u2029 "quoted"'),
+        ('linked', (i for i in [{'title': None, 'count': 1}, [True, 2.5]])),
+        (1, 'key'),
+    ])
+
+
+def test_orjson_renderer_matches_json_renderer():
+    assert ORJSONRenderer().render(sample()) == \
+        JSONRenderer().render(sample())
+    assert ORJSONRenderer().render(None) == b''
+    assert ORJSONRenderer().render({'big': 2 ** 70}) == \
+        JSONRenderer().render({'big': 2 ** 70})
+
+
+def test_orjson_renderer_indents_on_request():
+    renderer = ORJSONRenderer()
+    data = {'uuid': UUID, 'steps': [1, 2]}
+
+    assert renderer.render(data, 'application/json; indent=4') == \
+        JSONRenderer().render(data, 'application/json; indent=4')
+    assert renderer.render(data, None, {'indent': 2}) == \
+        JSONRenderer().render(data, None, {'indent': 2})
+
+
+@pytest.mark.django_db
+def test_api_renders_with_orjson(client, sequence, make_linked_steps):
+    make_linked_steps(sequence.step, 2)
+    url = reverse('api:sequence', kwargs={'uuid': sequence.step.uuid})
+
+    response = client.get(url, {'depth': 2})
+
+    assert isinstance(response.accepted_renderer, ORJSONRenderer)
+    assert response.content == JSONRenderer().render(response.data)
+
+
+@pytest.fixture
+def msgpack():
+    return pytest.importorskip('msgpack')
+
+
+def test_msgpack_renderer_writes_json_strings(msgpack):
+    from api.functions.custom_renderers import MessagePackRenderer
+
+    data = {'uuid': UUID, 'utc': UTC, 'count': 2}
+    content = MessagePackRenderer().render(data)
+
+    assert msgpack.unpackb(content) == {'uuid': str(UUID),
+                                        'utc': '2022-07-01T12:30:05.000120Z',
+                                        'count': 2}
+
+
+@pytest.mark.django_db
+def test_api_negotiates_msgpack(client, msgpack, step):
+    url = reverse('api:step', kwargs={'uuid': step.uuid})
+    response = client.get(url, HTTP_ACCEPT='application/msgpack')
+
+    assert response['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(response.content) == client.get(url).json()
+
+    url = reverse('api:step-list')
+    response = client.post(url, msgpack.packb({'title': 'Packed'}),
+                           content_type='application/msgpack')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Step.objects.filter(title='Packed').exists()
+
+    response = client.post(url, b'\xc1',
+                           content_type='application/msgpack')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
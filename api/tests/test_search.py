@@ -0,0 +1,121 @@
+import pytest
+
+from django.urls import reverse
+from rest_framework import status
+
+from api.functions.search import search, search_query, trigram_available
+from api.models.content import Explanation
+from api.models.step import Step
+
+
+@pytest.fixture
+def documents(sequence, make_step):
+    sequence.step.title = 'Installing Python'
+    sequence.step.save()
+
+    titles = ['Install the database', 'Configure the database',
+              'Python basics', None]
+    steps = []
+    for title in titles:
+        step = make_step()
+        step.title = title
+        step.save()
+        steps.append(step)
+
+    Explanation.objects.create(type='text', title='Databases',
+                               content='Tables, indexes and queries')
+    Explanation.objects.create(type='code', title='Snippet',
+                               content='pip install django')
+    return sequence, steps
+
+
+@pytest.mark.django_db
+def test_search_query_matches_word_prefixes(documents):
+    assert search_query('!!') is None
+
+    steps = search(Step.objects.all(), "Datab' & inst")
+    assert [step.title for step in steps] == ['Install the database']
+
+
+@pytest.mark.django_db
+def test_search_keeps_vector_up_to_date(documents):
+    _, steps = documents
+    assert [step.title for step in search(Step.objects.all(), 'conf')] == \
+        ['Configure the database']
+
+    Step.objects.filter(pk=steps[1].pk).update(title='Tune the database')
+    assert not search(Step.objects.all(), 'conf').exists()
+    assert search(Step.objects.all(), 'tune').exists()
+
+    explanation = Explanation.objects.get(title='Snippet')
+    explanation.content = 'npm install react'
+    explanation.save()
+    assert search(Explanation.objects.all(), 'react').get() == explanation
+
+
+@pytest.mark.django_db
+def test_search_step_list(client, documents):
+    url = reverse('api:step-list')
+
+    response = client.get(url, {'search': 'databa'})
+    titles = [i['title'] for i in response.data['results']]
+    assert sorted(titles) == ['Configure the database',
+                              'Install the database']
+    assert 'search' not in response.data['results'][0]
+
+    response = client.get(url, {'search': 'python'})
+    titles = [i['title'] for i in response.data['results']]
+    assert titles == ['Python basics']
+
+
+@pytest.mark.django_db
+def test_search_sequence_list(client, documents):
+    url = reverse('api:sequence-list')
+
+    response = client.get(url, {'search': 'install pyth'})
+    assert [i['uuid'] for i in response.data['results']] == \
+        [str(documents[0].step.uuid)]
+
+    response = client.get(url, {'search': 'database'})
+    assert response.data['results'] == []
+
+
+@pytest.mark.django_db
+def test_search_across_documents(client, documents):
+    url = reverse('api:search')
+
+    response = client.get(url, {'q': 'install'})
+
+    assert response.status_code == status.HTTP_200_OK
+    results = response.data['results']
+    assert {(i['kind'], i['title']) for i in results} == \
+        {('sequence', 'Installing Python'),
+         ('step', 'Install the database'),
+         ('explanation', 'Snippet')}
+    # Title matches outrank content matches
+    assert results[-1]['title'] == 'Snippet'
+    assert results[-1]['url'] is None
+    assert [i['rank'] for i in results] == \
+        sorted((i['rank'] for i in results), reverse=True)
+
+    sequence_url = reverse('api:sequence',
+                           kwargs={'uuid': documents[0].step.uuid})
+    assert any(i['url'].endswith(sequence_url) for i in results
+               if i['kind'] == 'sequence')
+
+
+@pytest.mark.django_db
+def test_search_requires_query(client):
+    url = reverse('api:search')
+    response = client.get(url)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_search_matches_typos(client, documents):
+    if not trigram_available():
+        pytest.skip('pg_trgm is not available')
+
+    url = reverse('api:step-list')
+    response = client.get(url, {'search': 'datbase'})
+    assert len(response.data['results']) == 2
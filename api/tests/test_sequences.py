@@ -1,11 +1,21 @@
 import pytest
 
+import io
+import json
 import uuid
 
+from django.core.management import call_command
 from django.urls import reverse
 from rest_framework import status
 
-from api.models.step import Step
+from api.base.exceptions import CircularReference
+from api.models.sequence import (
+    PublishedSequence,
+    PublishedStep,
+    Sequence,
+    SequenceSnapshot)
+from api.models.step import LinkedStep, Step, StepGraphVersion
+from api.serializers.sequence_serializers import SequencesSerializer
 from api.base.choices import StepChoices
 
 
@@ -16,7 +26,7 @@ def test_get_sequence_by_uuid(client, sequence):
 
     response = client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert response.data['uuid'] == str(sequence.uuid)
+    assert response.json()['uuid'] == str(sequence.uuid)
 
 
 @pytest.mark.django_db
@@ -34,11 +44,11 @@ def test_get_sequence_fields(client, sequence):
                        'published',
                        'title',
                        'linked']
-    received_fields = response.data.keys()
+    received_fields = response.json().keys()
 
     assert set(expected_fields) == set(received_fields)
-    assert response.data['uuid'] == str(sequence.uuid)
-    assert response.data['uuid'] == str(sequence.step.uuid)
+    assert response.json()['uuid'] == str(sequence.uuid)
+    assert response.json()['uuid'] == str(sequence.step.uuid)
 
 
 @pytest.mark.django_db
@@ -104,6 +114,21 @@ def test_delete_sequence(client, sequence):
         Step.objects.get(uuid=sequence.uuid)
 
 
+@pytest.mark.django_db
+def test_delete_published_sequence(client, sequence, make_linked_steps):
+    make_linked_steps(sequence.step, 2)
+    sequence.publish()
+    sequence.publish()
+
+    url = reverse('api:sequence', kwargs={'uuid': sequence.uuid})
+    response = client.delete(url)
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert not Sequence.objects.exists()
+    assert not PublishedSequence.objects.exists()
+    assert not PublishedStep.objects.exists()
+
+
 @pytest.mark.django_db
 def test_sequence_detail_shows_linked_steps(client, sequence,
                                             make_linked_steps):
@@ -125,7 +150,316 @@ def test_sequence_detail_shows_linked_steps(client, sequence,
                        'type',
                        'linked']
 
-    received_fields = response.data['linked'][0].keys()
+    received_fields = response.json()['linked'][0].keys()
 
     assert set(expected_fields) == set(received_fields)
-    assert response.data['linked'][0]['uuid'] == str(linked_step.sub.uuid)
+    assert response.json()['linked'][0]['uuid'] == str(linked_step.sub.uuid)
+
+
+@pytest.mark.parametrize('depth, width',
+                         [(1, 1),
+                          (1, 10),
+                          (10, 1),
+                          (4, 3)])
+@pytest.mark.django_db
+def test_sequence_detail_query_count_is_constant(client,
+                                                 django_assert_num_queries,
+                                                 depth, width, sequence,
+                                                 make_linked_steps):
+    supers = [sequence.step]
+    for _ in range(depth):
+        linked_steps = make_linked_steps(super=supers[-1], sub=width)
+        supers.append(linked_steps[-1].sub)
+
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+
+    LinkedStep.graph()
+
+    # Renders and stores the snapshot
+    with django_assert_num_queries(10):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    with django_assert_num_queries(2):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_sequence_detail_limits_depth(client, sequence, make_linked_steps):
+    child = make_linked_steps(super=sequence.step, sub=1)[0].sub
+    make_linked_steps(super=child, sub=2)
+
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+
+    response = client.get(url, {'depth': 1})
+    assert response.status_code == status.HTTP_200_OK
+
+    stub = response.json()['linked'][0]
+    assert stub['uuid'] == str(child.uuid)
+    assert stub['child_count'] == 2
+    assert 'linked' not in stub
+    assert not SequenceSnapshot.objects.exists()
+
+
+@pytest.mark.django_db
+def test_sequence_detail_streams_tree(client, sequence, make_linked_steps):
+    for linked_step in make_linked_steps(super=sequence.step, sub=2):
+        make_linked_steps(super=linked_step.sub, sub=1)
+
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+
+    response = client.get(url, {'stream': 'true'})
+    assert response.streaming
+
+    content = json.loads(b''.join(response.streaming_content))
+    assert content == client.get(url).json()
+
+
+@pytest.mark.django_db
+def test_sequence_detail_answers_conditional_requests(client, sequence):
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+
+    etag = client.get(url)['ETag']
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    sequence.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_sequence_detail_is_served_from_snapshot(client, sequence):
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+
+    response = client.get(url)
+
+    snapshot = SequenceSnapshot.objects.get(sequence=sequence)
+    assert bytes(snapshot.content) == response.content
+
+
+@pytest.mark.django_db
+def test_sequence_snapshot_is_only_served_as_compact_json(client, s3,
+                                                          sequence):
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+
+    response = client.get(url, HTTP_ACCEPT='application/json; indent=4')
+    assert response.content.startswith(b'{\n    "url"')
+    # The browsable API links its static files in the bucket, hence s3
+    response = client.get(url, HTTP_ACCEPT='text/html')
+    assert response['Content-Type'].startswith('text/html')
+    assert not SequenceSnapshot.objects.exists()
+
+    response = client.get(url)
+    snapshot = SequenceSnapshot.objects.get(sequence=sequence)
+    assert bytes(snapshot.content) == response.content
+    assert b'\n' not in response.content
+
+    response = client.get(url, HTTP_ACCEPT='application/json; indent=4')
+    assert response.content.startswith(b'{\n    "url"')
+
+
+@pytest.mark.django_db
+def test_sequence_snapshot_is_invalidated_by_sub_step_changes(
+        faker, client, sequence, make_linked_steps):
+    child = make_linked_steps(super=sequence.step, sub=1)[0].sub
+    grandchild = make_linked_steps(super=child, sub=1)[0].sub
+
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence', kwargs=kwargs)
+    client.get(url)
+
+    title = faker.sentence()
+    client.patch(reverse('api:step', kwargs={'uuid': grandchild.uuid}),
+                 {'title': title})
+
+    response = client.get(url)
+    assert response.json()['linked'][0]['linked'][0]['title'] == title
+
+    make_linked_steps(super=grandchild, sub=1)
+
+    response = client.get(url)
+    assert len(response.json()['linked'][0]['linked'][0]['linked']) == 1
+
+
+@pytest.mark.django_db
+def test_sequence_snapshots_are_invalidated_by_shared_steps(
+        faker, client, make_step, make_linked_steps):
+    # sequence0    sequence1
+    # L shared     L shared
+
+    shared = make_step()
+    urls = []
+    for _ in range(2):
+        step = make_step(type=StepChoices.SEQUENCE)
+        sequence = Sequence.objects.create(step=step)
+        LinkedStep.objects.create(super=step, sub=shared)
+        urls.append(reverse('api:sequence', kwargs={'uuid': sequence.uuid}))
+        client.get(urls[-1])
+
+    title = faker.sentence()
+    client.patch(reverse('api:step', kwargs={'uuid': shared.uuid}),
+                 {'title': title})
+
+    for url in urls:
+        response = client.get(url)
+        assert response.json()['linked'][0]['title'] == title
+
+
+@pytest.mark.django_db
+def test_sequence_snapshot_is_not_stored_when_invalidated(client, sequence):
+    snapshot = SequenceSnapshot.objects.create(sequence=sequence,
+                                               base_url='http://testserver/')
+    SequenceSnapshot.objects.filter(sequence=sequence).invalidate()
+
+    assert snapshot.store(b'{}') == 0
+
+    snapshot.refresh_from_db()
+    assert snapshot.content is None
+
+
+@pytest.mark.django_db
+def test_publish_sequence_flattens_tree(client, sequence, make_linked_steps):
+    children = make_linked_steps(super=sequence.step, sub=2)
+    grandchildren = make_linked_steps(super=children[0].sub, sub=2)
+
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence-publish', kwargs=kwargs)
+
+    response = client.post(url)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    published_sequence = PublishedSequence.objects.get(
+        uuid=response.data['uuid'])
+    published_steps = []
+    published_step = PublishedStep.objects.get(uuid=published_sequence.first)
+    while published_step:
+        published_steps.append(published_step)
+        published_step = PublishedStep.objects.filter(
+            uuid=published_step.next).first()
+
+    expected = [children[0], grandchildren[0], grandchildren[1], children[1]]
+    assert [i.title for i in published_steps] == \
+        [i.sub.title or '' for i in expected]
+    assert len(published_steps) == \
+        published_sequence.published_step_published_sequence.count()
+    assert published_steps[0].previous is None
+    assert published_steps[2].previous == published_steps[1].uuid
+
+    sequence.refresh_from_db()
+    assert sequence.is_published
+    assert sequence.published == published_sequence.published
+
+
+@pytest.mark.django_db
+def test_publish_sequence_repeats_shared_steps(sequence, make_step):
+    shared = make_step()
+    for _ in range(2):
+        step = make_step()
+        LinkedStep.objects.create(super=sequence.step, sub=step)
+        LinkedStep.objects.create(super=step, sub=shared)
+
+    published_sequence = sequence.publish()
+
+    published_steps = published_sequence.published_step_published_sequence
+    assert published_steps.count() == 4
+
+
+@pytest.mark.django_db
+def test_publish_sequence_rejects_circular_reference(sequence, make_step):
+    steps = [make_step() for _ in range(2)]
+    LinkedStep.objects.create(super=sequence.step, sub=steps[0])
+    LinkedStep.objects.create(super=steps[0], sub=steps[1])
+    # Cycles can only be left by links made before they were rejected
+    LinkedStep.objects.bulk_create([
+        LinkedStep(super=steps[1], sub=steps[0], rank='a')])
+    StepGraphVersion.bump()
+
+    with pytest.raises(CircularReference):
+        sequence.publish()
+    assert not PublishedSequence.objects.exists()
+
+
+@pytest.mark.django_db
+def test_publish_empty_sequence_is_rejected(client, sequence):
+    kwargs = {'uuid': sequence.uuid}
+    url = reverse('api:sequence-publish', kwargs=kwargs)
+
+    response = client.post(url)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not PublishedSequence.objects.exists()
+
+
+@pytest.mark.parametrize('width', [1, 50])
+@pytest.mark.django_db
+def test_publish_sequence_query_count_is_constant(django_assert_num_queries,
+                                                  width, sequence,
+                                                  make_linked_steps):
+    for linked_step in make_linked_steps(super=sequence.step, sub=width):
+        make_linked_steps(super=linked_step.sub, sub=2)
+    LinkedStep.graph()
+
+    with django_assert_num_queries(7):
+        sequence.publish()
+
+
+@pytest.mark.django_db
+def test_publish_sequence_command(sequence, make_linked_steps):
+    make_linked_steps(super=sequence.step, sub=2)
+
+    call_command('publish_sequence', str(sequence.uuid), stdout=io.StringIO())
+
+    assert PublishedStep.objects.filter(sequence=sequence).count() == 2
+
+
+@pytest.mark.parametrize('ordering', ['published', '-published', 'title'])
+@pytest.mark.django_db
+def test_page_sequence_list_with_cursor(client, ordering):
+    url = reverse('api:sequence-list')
+    for i in range(30):
+        client.post(url, {'title': f'sequence {i % 4}'})
+    sequences = list(Sequence.objects.order_by('pk'))
+    for i, sequence in enumerate(sequences[::3]):
+        Sequence.objects.filter(pk=sequence.pk) \
+                        .update(published=sequences[i % 3].created)
+    expected = Sequence.objects.order_by(
+        ordering.replace('title', 'step__title'),
+        '-pk' if ordering.startswith('-') else 'pk')
+    expected = [str(sequence.step.uuid) for sequence in expected]
+
+    uuids = []
+    response = client.get(url, {'cursor': '', 'ordering': ordering})
+    while True:
+        uuids.extend(i['uuid'] for i in response.data['results'])
+        if response.data['next'] is None:
+            break
+        response = client.get(response.data['next_url'])
+    assert uuids == expected
+
+
+@pytest.mark.django_db
+def test_sequence_list_matches_model_serializer(client, sequence,
+                                                make_linked_steps,
+                                                django_assert_num_queries):
+    url = reverse('api:sequence-list')
+    client.post(url, {'title': 'Unpublished'})
+    make_linked_steps(sequence.step)
+    sequence.publish()
+
+    with django_assert_num_queries(2):
+        response = client.get(url)
+
+    sequences = Sequence.objects.select_related('step').order_by('-updated')
+    expected = SequencesSerializer(sequences, many=True,
+                                   context={'request': response.wsgi_request})
+    assert json.dumps(response.data['results']) == json.dumps(expected.data)
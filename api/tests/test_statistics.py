@@ -0,0 +1,109 @@
+import pytest
+
+import io
+
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from api.base.choices import StepChoices
+from api.models.content import Explanation
+from api.models.statistics import Statistics
+from api.models.step import LinkedStep, Step
+
+
+COUNTERS = ['sequences', 'steps', 'super', 'sub', 'images',
+            'text_modules', 'code_modules']
+
+
+def counters():
+    statistics = Statistics.current()
+    return {name: getattr(statistics, name) for name in COUNTERS}
+
+
+def recounted():
+    _, drift = Statistics.reconcile()
+    return drift
+
+
+@pytest.mark.django_db
+def test_statistics(client, django_assert_num_queries, sequence,
+                    make_step, make_linked_steps, make_image):
+    super = make_step()
+    make_linked_steps(super, 3)
+    LinkedStep.objects.create(super=sequence.step, sub=super)
+    make_image()
+    Explanation.objects.create(type='text')
+    Explanation.objects.create(type='code')
+
+    url = reverse('api:statistics')
+    with django_assert_num_queries(1):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['sequences'] == 1
+    assert response.data['steps'] == 4
+    assert response.data['super'] == 4
+    assert response.data['sub'] == 3
+    assert response.data['images'] == 1
+    assert response.data['text_modules'] == 1
+    assert response.data['code_modules'] == 1
+    assert response.data['modules'] == 3
+
+
+@pytest.mark.django_db
+def test_statistics_follow_writes(client, sequence, make_step,
+                                  make_linked_steps, make_image):
+    counters()
+    steps = [make_step() for _ in range(3)]
+    make_linked_steps(steps[0], 2)
+    LinkedStep.bulk_link(steps[1], steps[2:])
+    LinkedStep.objects.create(super=sequence.step, sub=steps[0])
+    assert recounted() == {}
+
+    LinkedStep.objects.get(super=steps[1]).delete()
+    steps[0].delete()
+    assert recounted() == {}
+
+    url = reverse('api:sequence', kwargs={'uuid': sequence.step.uuid})
+    client.delete(url)
+    assert recounted() == {}
+
+    image = make_image()
+    explanation = Explanation.objects.create(type='text')
+    explanation.type = 'code'
+    explanation.save()
+    assert counters()['code_modules'] == 1
+    assert recounted() == {}
+
+    image.delete()
+    explanation.delete()
+    assert recounted() == {}
+    assert counters()['images'] == 0
+
+
+@pytest.mark.django_db
+def test_statistics_follow_step_type_changes(client, make_step):
+    step = make_step()
+    url = reverse('api:step', kwargs={'uuid': step.uuid})
+
+    client.patch(url, {'type': StepChoices.SEQUENCE})
+    assert counters()['steps'] == 0
+    assert recounted() == {}
+
+    client.patch(url, {'type': StepChoices.STEP})
+    assert counters()['steps'] == 1
+    assert recounted() == {}
+
+
+@pytest.mark.django_db
+def test_reconcile_statistics_fixes_drift(make_step):
+    make_step()
+    Statistics.objects.filter(id=1).update(steps=10, sub=0)
+
+    stdout = io.StringIO()
+    call_command('reconcile_statistics', stdout=stdout)
+
+    assert 'Fixed steps: 10 -> 1' in stdout.getvalue()
+    assert 'Fixed sub: 0 -> 1' in stdout.getvalue()
+    assert counters()['steps'] == Step.objects.count()
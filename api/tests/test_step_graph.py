@@ -0,0 +1,54 @@
+import pytest
+
+import uuid
+
+from api.functions.step_graph import StepGraph
+from api.models.step import LinkedStep
+
+
+def test_step_graph_round_trip(tmp_path):
+    path = str(tmp_path / 'graph')
+    version = uuid.uuid4()
+    edges = [(1, 30), (1, 20), (20, 40), (30, 40)]
+
+    StepGraph.write(path, version, edges)
+    graph = StepGraph.open(path)
+
+    assert graph.version == version
+    assert graph.children(1) == [30, 20]
+    assert graph.children(40) == []
+    assert graph.children(99) == []
+    assert sorted(graph.parents(40)) == [20, 30]
+    assert graph.parents(1) == []
+    assert graph.subtree(20) == {20: [40], 40: []}
+
+
+def test_step_graph_load_rebuilds_on_new_version(tmp_path):
+    path = str(tmp_path / 'graph')
+    version = uuid.uuid4()
+
+    graph = StepGraph.load(path, version, lambda: [(1, 2)])
+    assert StepGraph.load(path, version, lambda: []) is graph
+
+    graph = StepGraph.load(path, uuid.uuid4(), lambda: [(1, 3)])
+    assert graph.children(1) == [3]
+
+
+def test_step_graph_open_ignores_invalid_files(tmp_path):
+    path = tmp_path / 'graph'
+    assert StepGraph.open(str(path)) is None
+
+    path.write_bytes(b'not a graph')
+    assert StepGraph.open(str(path)) is None
+
+
+@pytest.mark.django_db
+def test_linked_step_writes_rebuild_graph(step, make_step):
+    sub = make_step()
+    assert LinkedStep.graph().children(step.pk) == []
+
+    linked_step = LinkedStep.objects.create(super=step, sub=sub)
+    assert LinkedStep.graph().children(step.pk) == [sub.pk]
+
+    linked_step.delete()
+    assert LinkedStep.graph().children(step.pk) == []
@@ -1,12 +1,14 @@
 import pytest
 
+import json
 import uuid
 
 from django.urls import reverse
 from rest_framework import status
 
 from api.base.choices import StepChoices
-from api.models.step import Step
+from api.models.step import LinkedStep, Step
+from api.serializers.step_serializers import StepsSerializer
 
 
 @pytest.mark.django_db
@@ -168,3 +170,313 @@ def test_step_detail_shows_linked_steps(client, step, make_linked_steps):
 
     assert set(expected_fields) == set(received_fields)
     assert response.data['linked'][0]['uuid'] == str(linked_step.sub.uuid)
+
+
+@pytest.mark.django_db
+def test_step_detail_shows_nested_linked_steps_in_order(client, step,
+                                                        make_linked_steps):
+    linked_steps = make_linked_steps(super=step, sub=2)
+    nested_steps = make_linked_steps(super=linked_steps[1].sub, sub=2)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    response = client.get(url)
+
+    received_uuids = [i['uuid'] for i in response.data['linked']]
+    expected_uuids = [str(i.sub.uuid) for i in linked_steps]
+    assert received_uuids == expected_uuids
+
+    received_uuids = [i['uuid'] for i in response.data['linked'][1]['linked']]
+    expected_uuids = [str(i.sub.uuid) for i in nested_steps]
+    assert received_uuids == expected_uuids
+
+
+@pytest.mark.parametrize('depth, width',
+                         [(1, 1),
+                          (1, 10),
+                          (10, 1),
+                          (4, 3)])
+@pytest.mark.django_db
+def test_step_detail_query_count_is_constant(client, django_assert_num_queries,
+                                             depth, width, step,
+                                             make_linked_steps):
+    supers = [step]
+    for _ in range(depth):
+        linked_steps = make_linked_steps(super=supers[-1], sub=width)
+        supers.append(linked_steps[-1].sub)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    LinkedStep.graph()
+
+    with django_assert_num_queries(4):
+        response = client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_step_ancestors_and_descendants(make_step):
+    # top
+    # L left    L right
+    #   L bottom  L bottom
+
+    top, left, right, bottom = [make_step() for _ in range(4)]
+    LinkedStep.objects.create(super=top, sub=left)
+    LinkedStep.objects.create(super=top, sub=right)
+    LinkedStep.objects.create(super=left, sub=bottom)
+    LinkedStep.objects.create(super=right, sub=bottom)
+
+    assert set(bottom.ancestors()) == {top, left, right}
+    assert set(top.descendants()) == {left, right, bottom}
+    assert not top.ancestors().exists()
+    assert not bottom.descendants().exists()
+
+
+@pytest.mark.parametrize('levels', [1, 10, 50])
+@pytest.mark.django_db
+def test_step_ancestors_query_count_is_constant(django_assert_num_queries,
+                                                levels, make_step):
+    bottom = make_step()
+    subs = [bottom]
+    for _ in range(levels):
+        supers = [make_step() for _ in range(2)]
+        for super in supers:
+            for sub in subs:
+                LinkedStep.objects.create(super=super, sub=sub)
+        subs = supers
+
+    with django_assert_num_queries(1):
+        assert len(bottom.ancestors()) == 2 * levels
+
+
+@pytest.mark.django_db
+def test_step_usage_lists_super_steps(client, make_step, make_linked_steps):
+    step = make_step()
+    supers = [make_step() for _ in range(2)]
+    for super in supers:
+        LinkedStep.objects.create(super=super, sub=step)
+    make_linked_steps(super=make_step(), sub=1)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step-usage', kwargs=kwargs)
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+
+    received_uuids = {i['uuid'] for i in response.data['results']}
+    assert received_uuids == {str(super.uuid) for super in supers}
+
+
+@pytest.mark.django_db
+def test_step_detail_limits_depth(client, step, make_linked_steps):
+    child = make_linked_steps(super=step, sub=1)[0].sub
+    grandchildren = make_linked_steps(super=child, sub=2)
+    make_linked_steps(super=grandchildren[0].sub, sub=3)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    response = client.get(url, {'depth': 2})
+    assert response.status_code == status.HTTP_200_OK
+
+    stubs = response.data['linked'][0]['linked']
+    assert [i['uuid'] for i in stubs] == \
+        [str(i.sub.uuid) for i in grandchildren]
+    assert [i['child_count'] for i in stubs] == [3, 0]
+    assert [i['has_children'] for i in stubs] == [True, False]
+    assert 'linked' not in stubs[0]
+
+    response = client.get(stubs[0]['url_expand'])
+    assert len(response.data['linked']) == 3
+
+
+@pytest.mark.django_db
+def test_step_detail_rejects_invalid_depth(client, step):
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    response = client.get(url, {'depth': 0})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_step_detail_stops_at_max_nodes(client, settings, step, make_step,
+                                        make_linked_steps):
+    settings.STEP_TREE_MAX_NODES = 6
+    children = make_linked_steps(super=step, sub=2)
+    for linked_step in children:
+        make_linked_steps(super=linked_step.sub, sub=2)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    # The root and its children fit, the grandchildren would not
+    response = client.get(url)
+    assert [i['child_count'] for i in response.data['linked']] == [2, 2]
+
+    settings.STEP_TREE_MAX_NODES = 7
+    response = client.get(url)
+    assert [len(i['linked']) for i in response.data['linked']] == [2, 2]
+
+
+@pytest.mark.django_db
+def test_step_detail_streams_tree(client, step, make_linked_steps):
+    for linked_step in make_linked_steps(super=step, sub=2):
+        make_linked_steps(super=linked_step.sub, sub=2)
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    response = client.get(url, {'stream': 'true'})
+    assert response.streaming
+
+    content = json.loads(b''.join(response.streaming_content))
+    assert content == client.get(url).json()
+
+
+@pytest.mark.django_db
+def test_step_list_streams_all_steps(client, make_step):
+    steps = [make_step() for _ in range(25)]
+
+    url = reverse('api:step-list')
+
+    response = client.get(url, {'stream': 'true', 'ordering': 'created'})
+    assert response.streaming
+
+    content = json.loads(b''.join(response.streaming_content))
+    assert [i['uuid'] for i in content] == [str(i.uuid) for i in steps]
+
+
+@pytest.mark.django_db
+def test_step_detail_answers_conditional_requests(client,
+                                                  django_assert_num_queries,
+                                                  step, make_linked_steps):
+    child = make_linked_steps(super=step, sub=1)[0].sub
+    grandchild = make_linked_steps(super=child, sub=1)[0].sub
+
+    kwargs = {'uuid': step.uuid}
+    url = reverse('api:step', kwargs=kwargs)
+
+    response = client.get(url)
+    etag = response['ETag']
+
+    with django_assert_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    last_modified = response['Last-Modified']
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    grandchild.title = 'Changed'
+    grandchild.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response['ETag']
+
+    LinkedStep.objects.get(super=child).delete()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+
+def page_through(client, url, params, key='next'):
+    uuids = []
+    response = client.get(url, params)
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        uuids.extend(i['uuid'] for i in response.data['results'])
+        if response.data[key] is None:
+            return uuids, response
+        response = client.get(response.data[f'{key}_url'])
+
+
+@pytest.mark.parametrize('ordering', ['-updated', 'created', 'title',
+                                      '-title'])
+@pytest.mark.django_db
+def test_page_step_list_with_cursor(client, make_step, ordering):
+    steps = [make_step() for _ in range(45)]
+    # Ties and missing titles are ordered by id
+    for i, step in enumerate(steps):
+        Step.objects.filter(pk=step.pk).update(
+            title=None if i % 5 == 0 else f'step {i % 3}',
+            updated=steps[0].updated)
+    expected = Step.objects.order_by(ordering, 'pk' if ordering[0] != '-'
+                                     else '-pk')
+    expected = [str(step.uuid) for step in expected]
+
+    url = reverse('api:step-list')
+    uuids, last = page_through(client, url, {'cursor': '',
+                                             'ordering': ordering})
+    assert uuids == expected
+
+    uuids, first = page_through(client, last.data['previous_url'], {},
+                                key='previous')
+    assert uuids == expected[20:40] + expected[:20]
+    assert first.data['results'][0]['uuid'] == expected[0]
+
+
+@pytest.mark.django_db
+def test_cursor_page_skips_count(client, make_step,
+                                 django_assert_num_queries):
+    for _ in range(25):
+        make_step()
+    url = reverse('api:step-list')
+
+    with django_assert_num_queries(1):
+        response = client.get(url, {'cursor': ''})
+    assert response.data['count'] is None
+    assert len(response.data['results']) == 20
+
+    with django_assert_num_queries(1):
+        response = client.get(response.data['next_url'])
+    assert len(response.data['results']) == 5
+    assert response.data['next'] is None
+
+    response = client.get(url, {'cursor': '', 'count': 'true'})
+    assert response.data['count'] == 25
+    with django_assert_num_queries(1):
+        response = client.get(url, {'cursor': '', 'count': 'true'})
+    assert response.data['count'] == 25
+
+    response = client.get(url, {'cursor': '', 'count': 'estimate'})
+    assert isinstance(response.data['count'], int)
+
+
+@pytest.mark.django_db
+def test_cursor_must_match_ordering(client, make_step):
+    for _ in range(25):
+        make_step()
+    url = reverse('api:step-list')
+
+    response = client.get(url, {'cursor': ''})
+    cursor = response.data['next']
+
+    response = client.get(url, {'cursor': cursor, 'ordering': 'title'})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = client.get(url, {'cursor': 'not-a-cursor'})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_step_list_matches_model_serializer(client, make_step,
+                                            django_assert_num_queries):
+    for _ in range(3):
+        make_step()
+    Step.objects.filter(pk=make_step().pk).update(title=None)
+    url = reverse('api:step-list')
+
+    with django_assert_num_queries(2):
+        response = client.get(url)
+
+    steps = Step.objects.exclude(type=StepChoices.SEQUENCE) \
+                        .order_by('-updated')
+    expected = StepsSerializer(steps, many=True,
+                               context={'request': response.wsgi_request})
+    assert json.dumps(response.data['results']) == json.dumps(expected.data)
@@ -0,0 +1,100 @@
+import pytest
+
+import threading
+
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from rest_framework import status
+
+from api.functions import storage_deletion
+from api.functions.storage_deletion import delete_files, delete_objects
+from api.models.content import Image
+from sequenceapi.storages import MediaRootS3Boto3Storage, s3_client
+
+
+def deleted(keys, errors=()):
+    return {'Deleted': [{'Key': key} for key in keys if key not in errors],
+            'Errors': [{'Key': key, 'Code': 'InternalError'}
+                       for key in errors]}
+
+
+def expect_delete(stubber, keys, errors=()):
+    stubber.add_response(
+        'delete_objects',
+        deleted(keys, errors),
+        {'Bucket': 'tiverspace',
+         'Delete': {'Objects': [{'Key': key} for key in keys],
+                    'Quiet': True}})
+
+
+def test_s3_client_is_shared():
+    assert s3_client() is s3_client()
+
+    storage = MediaRootS3Boto3Storage()
+    assert storage.connection.meta.client is s3_client()
+    assert storage.bucket.meta.client is s3_client()
+
+    # Every thread has its own resource on top of the shared client
+    connections = []
+    thread = threading.Thread(
+        target=lambda: connections.append(storage.connection))
+    thread.start()
+    thread.join()
+    assert connections[0] is not storage.connection
+    assert connections[0].meta.client is s3_client()
+
+
+def test_delete_objects_in_batches(s3):
+    keys = [f'key-{i}' for i in range(2500)]
+    for i in range(0, 2500, 1000):
+        expect_delete(s3, keys[i:i + 1000])
+
+    assert delete_objects('tiverspace', keys) == []
+
+
+def test_delete_objects_retries_failed_keys(s3):
+    expect_delete(s3, ['a', 'b', 'c'], errors=['b'])
+    s3.add_client_error('delete_objects', service_error_code='SlowDown')
+    expect_delete(s3, ['b'])
+
+    assert delete_objects('tiverspace', ['a', 'b', 'c']) == []
+
+
+def test_delete_objects_gives_up(s3):
+    for _ in range(3):
+        expect_delete(s3, ['a'], errors=['a'])
+
+    assert delete_objects('tiverspace', ['a'], retries=2) == ['a']
+
+
+@pytest.mark.django_db
+def test_delete_files_queues_s3_keys(s3, django_capture_on_commit_callbacks):
+    storage = MediaRootS3Boto3Storage()
+    expect_delete(s3, ['sequence/api/media/a.png',
+                       'sequence/api/media/a-thumbnail.webp'])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        delete_files(storage, ['a.png', 'a-thumbnail.webp'])
+    storage_deletion.flush()
+
+
+@pytest.mark.django_db
+def test_delete_image_removes_files(client, media_storage,
+                                    django_capture_on_commit_callbacks):
+    image = Image(title='photo.png')
+    image.image.save('photo.png', ContentFile(b'GIF89a'))
+    image.variants = [{'name': 'photo.png', 'width': 1, 'height': 1,
+                       'format': 'png'}]
+    image.save()
+    assert (media_storage / 'photo.png').exists()
+
+    url = reverse('api:image', kwargs={'uuid': image.uuid})
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.delete(url)
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert not Image.objects.exists()
+    assert not (media_storage / 'photo.png').exists()
+
+    response = client.delete(url)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -4,7 +4,21 @@ from rest_framework.urlpatterns import format_suffix_patterns
 
 from api.views.api_root import APIRoot
 from api.views.general_views import StatisticView
-from api.views.sequence_views import SequenceListView, SequenceView
+from api.views.guide_views import (
+    SequenceGuideListView,
+    SequenceGuideView,
+    StepGuideView)
+from api.views.media_views import (
+    ImageDetailView,
+    ImageFinalizeView,
+    ImageRenderView,
+    ImageUploadView,
+    ImageView)
+from api.views.search_views import SearchView
+from api.views.sequence_views import (
+    SequenceListView,
+    SequencePublishView,
+    SequenceView)
 from api.views.step_views import (
     StepsView,
     StepView,
@@ -27,6 +41,9 @@ urlpatterns = [
     path('sequences/<uuid:uuid>/',
          SequenceView.as_view(),
          name='sequence'),
+    path('sequences/<uuid:uuid>/publish/',
+         SequencePublishView.as_view(),
+         name='sequence-publish'),
 
     path('steps/',
          StepsView.as_view(),
@@ -50,6 +67,36 @@ urlpatterns = [
          StepUsageView.as_view(),
          name='step-usage'),
 
+    path('guides/',
+         SequenceGuideListView.as_view(),
+         name='guide-list'),
+    path('guides/<uuid:uuid>/',
+         SequenceGuideView.as_view(),
+         name='guide'),
+    path('guides/steps/<uuid:uuid>/',
+         StepGuideView.as_view(),
+         name='guide-step'),
+
+    path('images/',
+         ImageView.as_view(),
+         name='image-list'),
+    path('images/uploads/',
+         ImageUploadView.as_view(),
+         name='image-upload'),
+    path('images/uploads/<uuid:uuid>/',
+         ImageFinalizeView.as_view(),
+         name='image-upload-finalize'),
+    path('images/<uuid:uuid>/',
+         ImageDetailView.as_view(),
+         name='image'),
+    path('images/<uuid:uuid>/render/',
+         ImageRenderView.as_view(),
+         name='image-render'),
+
+    path('search/',
+         SearchView.as_view(),
+         name='search'),
+
     path('statistics/',
          StatisticView.as_view(),
          name='statistics')]
@@ -9,4 +9,6 @@ class APIRoot(APIView):
             'statistics': reverse('api:statistics', request=request),
             'sequences': reverse('api:sequence-list', request=request),
             'steps': reverse('api:step-list', request=request),
+            'guides': reverse('api:guide-list', request=request),
+            'search': reverse('api:search', request=request),
         })
@@ -1,70 +1,71 @@
-import re
-
-from rest_framework.views import APIView
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework.views import APIView
 
-from api.models.content import Image
-from api.models.sequence import SequenceGuide, SequenceGuideStep
+from api.functions.media_urls import (
+    IMAGE_PLACEHOLDER,
+    expand_image_placeholders)
+from api.models.sequence import PublishedSequence, PublishedStep
 from api.serializers.guide_serializers import (
     SequenceGuideSerializer,
     StepGuideSerializer)
 
 
+# Published rows never change, the list only grows with new publications
+GUIDE_MAX_AGE = 60 * 60 * 24 * 365
+GUIDE_LIST_MAX_AGE = 60
+
+
 class SequenceGuideListView(APIView):
-    def get(self, request, space):
-        spaces_dict = {
-            'test': 'TST',
-            'preview': 'PRV',
-            'public': 'PBL',
-            'private': 'PRV',
-        }
-        guide_sequence = SequenceGuide.objects.filter(space=spaces_dict[space])
-        serializer = SequenceGuideSerializer(guide_sequence,
+    def get(self, request):
+        # Only the latest publication of every sequence
+        guides = PublishedSequence.objects.order_by('sequence_id',
+                                                    '-published') \
+                                          .distinct('sequence_id')
+        serializer = SequenceGuideSerializer(guides,
                                              many=True,
                                              context={'request': request})
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        patch_cache_control(response,
+                            public=True,
+                            max_age=GUIDE_LIST_MAX_AGE)
+        return response
 
 
 class SequenceGuideView(APIView):
-    def get(self, request, api_id, space):
-        spaces_dict = {
-            'test': 'TST',
-            'preview': 'PRV',
-            'public': 'PBL',
-            'private': 'PRV',
-        }
-        guide_sequence = SequenceGuide.objects.get(
-            api_id=api_id, space=spaces_dict[space])
-        serializer = SequenceGuideSerializer(guide_sequence,
+    def get(self, request, uuid):
+        guide = get_object_or_404(PublishedSequence, uuid=uuid)
+        serializer = SequenceGuideSerializer(guide,
                                              context={'request': request})
-        return Response(serializer.data)
+        response = Response(serializer.data)
+        patch_cache_control(response,
+                            public=True,
+                            max_age=GUIDE_MAX_AGE,
+                            immutable=True)
+        return response
 
 
 class StepGuideView(APIView):
-    def get(self, request, step_api_id):
-        try:
-            guide_step = SequenceGuideStep.objects.get(
-                api_id=step_api_id)
-        except SequenceGuideStep.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-
+    def get(self, request, uuid):
+        guide_step = get_object_or_404(
+            PublishedStep.objects.select_related('published_sequence'),
+            uuid=uuid)
         serializer = StepGuideSerializer(guide_step,
                                          context={'request': request})
-        serialized_data = serializer.data
-        serialized_data['content'] = self.insert_media_url(
-            serialized_data['content'])
-        return Response(serialized_data)
-
-    def insert_media_url(self, content):
-        # It is required to generate the media urls every time. Reason is that
-        # media is served over AWS Bucket
-        pattern = re.compile(r'(?:\[\[img\|)([a-z0-9]{8})(?:\]\])') or False
-        image_ids = re.findall(pattern, content)
-
-        if image_ids:
-            for image_id in image_ids:
-                image = Image.objects.get(api_id=image_id)
-                replace = '[[img|' + image_id + ']]'
-                content = content.replace(replace, image.image.url)
-        return content
+        data = serializer.data
+        response = Response({
+            **data,
+            'content': expand_image_placeholders(data['content'])})
+        if IMAGE_PLACEHOLDER.search(data['content']):
+            # Image urls are signed, the response may not outlive them
+            patch_cache_control(response,
+                                public=True,
+                                max_age=settings.IMAGE_URL_CACHE_TIMEOUT)
+        else:
+            patch_cache_control(response,
+                                public=True,
+                                max_age=GUIDE_MAX_AGE,
+                                immutable=True)
+        return response
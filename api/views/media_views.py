@@ -1,16 +1,40 @@
-import boto3
-import uuid
+import mimetypes
 
 
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from ..functions.custom_renderers import JPEGRenderer, PNGRenderer
 from django.conf import settings
-
-from api.models.step import Image
-from api.serializers.media_serializers import (ImageSerializer,
-                                               ImageDetailSerializer)
+from django.db import transaction
+from django.http import (
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse)
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers)
+from django.utils.http import http_date
+
+from api.base.exceptions import NotAValidUpload
+from api.functions.custom_renderers import (
+    JPEGRenderer,
+    PNGRenderer,
+    WebPRenderer)
+from api.functions.image_streaming import (
+    StoredFile,
+    parse_range,
+    storage_url)
+from api.functions.image_uploads import finish_upload, start_upload
+from api.functions.image_variants import image_storage, schedule_variants
+from api.functions.upload_handlers import HashingUploadHandler
+from api.models.content import Image, ImageBlob
+from api.serializers.media_serializers import (
+    ImageDetailSerializer,
+    ImageFinalizeSerializer,
+    ImageRenderSerializer,
+    ImageSerializer,
+    ImageUploadSerializer)
 
 
 class ImageView(APIView):
@@ -21,66 +45,166 @@ class ImageView(APIView):
                                      context={'request': request})
         return Response(serializer.data)
 
-    def post(self, request, *args, **kwargs):
-        if request.data['image']:
-            orig_name = request.data['image'].name
-            api_id = str(uuid.uuid4())
-            request.data['image'].name = api_id + \
-                '.' + orig_name.split('.')[-1]
+    def initial(self, request, *args, **kwargs):
+        # Uploads are hashed while they are received, before anything can
+        # read the request body
+        self.hashing = HashingUploadHandler(request)
+        request.upload_handlers.insert(0, self.hashing)
+        super().initial(request, *args, **kwargs)
 
+    def post(self, request, *args, **kwargs):
+        upload = request.data.get('image')
+        if not upload:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            blob, created = ImageBlob.acquire(self.hashing.digests['image'],
+                                              upload)
+            # Images of the same content share their variants, which are
+            # generated once per blob and recorded on it and its images
             image = Image.objects.create(
-                api_id=api_id,
-                image=request.data['image'],
-                title=orig_name,
+                image=blob.name,
+                blob=blob,
+                variants=blob.variants,
+                title=upload.name,
                 caption=request.data.get('caption', None),
             )
-            serializer = ImageDetailSerializer(
-                image,
-                context={'request': request}
-            )
-
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        if created:
+            schedule_variants(image)
+        serializer = ImageDetailSerializer(
+            image,
+            context={'request': request}
+        )
+
+        return Response(serializer.data,
+                        status=status.HTTP_201_CREATED)
+
+
+class ImageUploadView(APIView):
+    """
+    Starts a direct upload to the bucket, the image is created once the
+    upload is finalized.
+    """
+
+    def post(self, request):
+        serializer = ImageUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_upload(image_storage(), **serializer.validated_data)
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+
+class ImageFinalizeView(APIView):
+    def post(self, request, uuid):
+        serializer = ImageFinalizeSerializer(data=request.data,
+                                             context={'uuid': uuid})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        upload = data['token']
+        if Image.objects.filter(uuid=uuid).exists():
+            return Response(status=status.HTTP_409_CONFLICT)
+        # A file owned by a blob is shared with other images and must not
+        # be claimed, and deleted, by a single one
+        if ImageBlob.objects.filter(name=upload['name']).exists():
+            raise NotAValidUpload()
+
+        finish_upload(image_storage(),
+                      upload['name'],
+                      upload_id=upload['upload_id'],
+                      parts=data.get('parts'))
+        image = Image.objects.create(
+            uuid=uuid,
+            image=upload['name'],
+            title=data.get('title', upload['name']),
+            caption=data.get('caption'))
+        schedule_variants(image)
+        serializer = ImageDetailSerializer(image,
+                                           context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 class ImageDetailView(APIView):
-    def get(self, request, api_id):
+    def get(self, request, uuid):
         try:
-            images = Image.objects.get(api_id=api_id)
+            images = Image.objects.get(uuid=uuid)
         except Image.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = ImageDetailSerializer(images,
                                            context={'request': request})
         return Response(serializer.data)
 
-    def delete(self, request, api_id):
-        image = Image.objects.get(api_id=api_id)
-
-        session = boto3.session.Session()
-        client = session.client(
-            's3',
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            aws_access_key_id=settings.AWS_S3_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_S3_SECRET_ACCESS_KEY
-            )
-
-        # Failed Storage deletion will not do anything
-        client.delete_object(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-            Key=f'{settings.MEDIAFILES_LOCATION}/{image.image.name}'
-            )
+    def delete(self, request, uuid):
+        try:
+            image = Image.objects.get(uuid=uuid)
+        except Image.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
 
-        # Delete image link in database
+        # The stored files are removed in the background
         image.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class ImageRenderView(APIView):
-    renderer_classes = [JPEGRenderer, PNGRenderer]
+    renderer_classes = [JPEGRenderer, PNGRenderer, WebPRenderer]
     authentication_classes = []
 
-    def get(self, request, api_id, media_type):
-        image = Image.objects.get(api_id=api_id)
+    def get(self, request, uuid):
+        image = Image.objects.get(uuid=uuid)
+
+        params = ImageRenderSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        webp = 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+        name = image.variant(params.validated_data.get('w'), webp)
+
+        storage = image_storage()
+        if settings.IMAGE_RENDER_MODE == 'redirect':
+            response = HttpResponseRedirect(storage_url(storage, name))
+            patch_cache_control(response,
+                                private=True,
+                                max_age=settings.IMAGE_URL_CACHE_TIMEOUT)
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        stored_file = StoredFile(storage, name)
+        response = get_conditional_response(
+            request,
+            etag=stored_file.etag,
+            last_modified=stored_file.last_modified)
+        if response is None:
+            response = self.stream(request, stored_file)
+
+        response['ETag'] = stored_file.etag
+        response['Last-Modified'] = http_date(stored_file.last_modified)
+        patch_cache_control(response,
+                            public=True,
+                            max_age=settings.IMAGE_MAX_AGE)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def stream(self, request, stored_file):
+        size = stored_file.size
+        content_type, _ = mimetypes.guess_type(stored_file.name)
+
+        # A range only applies to the representation the client already has
+        if_range = request.META.get('HTTP_IF_RANGE')
+        header = request.META.get('HTTP_RANGE')
+        if if_range and if_range != stored_file.etag:
+            header = None
 
-        return Response(image.image, status=status.HTTP_200_OK)
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            stored_file.chunks(start, end) if size else iter([]),
+            content_type=content_type)
+        if byte_range:
+            response.status_code = status.HTTP_206_PARTIAL_CONTENT
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1 if size else 0
+        response['Accept-Ranges'] = 'bytes'
+        return response
@@ -0,0 +1,48 @@
+from django.db.models import Case, CharField, Value, When
+from rest_framework.generics import ListAPIView
+
+from api.base.choices import StepChoices
+from api.functions.search import search
+from api.models.content import Explanation
+from api.models.step import Step
+from api.serializers.search_serializers import (
+    SearchResultSerializer,
+    SearchSerializer)
+from core.pagination import ListPagination
+
+
+class SearchPagination(ListPagination):
+    # Ranked results of several tables can only be paged by number
+    cursor_query_param = None
+
+
+class SearchView(ListAPIView):
+    """
+    Ranked search over the titles of steps and sequences and the titles
+    and content of explanations.
+    """
+    serializer_class = SearchResultSerializer
+    pagination_class = SearchPagination
+    filter_backends = []
+
+    def get_queryset(self):
+        params = SearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        term = params.validated_data['q']
+
+        fields = ['kind', 'uuid', 'title', 'search_rank']
+        steps = search(Step.objects.all(), term, trigram_fields=['title']) \
+            .annotate(kind=Case(When(type=StepChoices.SEQUENCE,
+                                     then=Value('sequence')),
+                                default=Value('step'),
+                                output_field=CharField())) \
+            .values(*fields) \
+            .order_by()
+        explanations = search(Explanation.objects.all(), term,
+                              trigram_fields=['title']) \
+            .annotate(kind=Value('explanation', output_field=CharField())) \
+            .values(*fields) \
+            .order_by()
+
+        return steps.union(explanations, all=True) \
+                    .order_by('-search_rank', 'kind', 'uuid')
@@ -1,27 +1,84 @@
+from django.http import HttpResponse
 from rest_framework import status
-from rest_framework.generics import ListCreateAPIView, RetrieveDestroyAPIView
+from rest_framework.generics import (
+    CreateAPIView,
+    ListCreateAPIView,
+    RetrieveDestroyAPIView)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from api.filters import SequenceSearchFilter, SequenceOrderingFilter
-from api.models.sequence import Sequence
+from api.filters import FullTextSearchFilter, SequenceOrderingFilter
+from api.functions.conditional import tree_condition
+from api.models.sequence import Sequence, SequenceSnapshot
 from api.models.step import Step
 from api.serializers.sequence_serializers import (
+    PublishedSequenceSerializer,
     SequenceSerializer,
+    SequencesLeanSerializer,
     SequencesSerializer)
+from api.serializers.step_serializers import TreeDepthSerializer
+from core.lean import LeanListMixin
 from core.pagination import ListPagination
+from core.streaming import (
+    StreamingJSONResponse,
+    StreamingListMixin,
+    is_streaming)
 
 
 class SequenceView(RetrieveDestroyAPIView):
     serializer_class = SequenceSerializer
 
+    @tree_condition
     def get(self, request, uuid):
-        sequence = Sequence.objects.get(step__uuid=uuid)
+        params = TreeDepthSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        depth = params.validated_data.get('depth')
+
+        stream = is_streaming(request)
+
+        # Snapshots only hold the full tree, rendered in one go as compact
+        # JSON. Other formats and indented JSON are rendered per request.
+        renderer = request.accepted_renderer
+        if depth is None and not stream and \
+                isinstance(renderer, JSONRenderer) and \
+                renderer.get_indent(request.accepted_media_type, {}) is None:
+            return self.get_snapshot(request, uuid)
+
+        sequence = Sequence.objects.select_related('step') \
+                                   .get(step__uuid=uuid)
         serializer = SequenceSerializer(sequence,
-                                        context={'request': request})
+                                        context={'request': request,
+                                                 'depth': depth,
+                                                 'stream': stream})
+        if stream:
+            return StreamingJSONResponse(serializer.data)
         return Response(serializer.data)
 
+    def get_snapshot(self, request, uuid):
+        # Urls in the snapshot are absolute, so it is stored per host
+        base_url = request.build_absolute_uri('/')
+        try:
+            snapshot = SequenceSnapshot.objects.get(sequence__step__uuid=uuid,
+                                                    base_url=base_url,
+                                                    content__isnull=False)
+        except SequenceSnapshot.DoesNotExist:
+            sequence = Sequence.objects.select_related('step') \
+                                       .get(step__uuid=uuid)
+            snapshot, _ = SequenceSnapshot.objects.get_or_create(
+                sequence=sequence,
+                base_url=base_url)
+
+            serializer = SequenceSerializer(sequence,
+                                            context={'request': request})
+            snapshot.store(request.accepted_renderer.render(serializer.data,
+                                                            None, {}))
+
+        return HttpResponse(bytes(snapshot.content),
+                            content_type=request.accepted_renderer.media_type)
+
     def patch(self, request, uuid):
-        sequence = Sequence.objects.get(step__uuid=uuid)
+        sequence = Sequence.objects.select_related('step') \
+                                   .get(step__uuid=uuid)
 
         context = {'request': request}
         serializer = SequenceSerializer(sequence,
@@ -39,12 +96,15 @@ class SequenceView(RetrieveDestroyAPIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class SequenceListView(ListCreateAPIView):
-    queryset = Sequence.objects.all().order_by('-updated')
+class SequenceListView(StreamingListMixin, LeanListMixin,
+                       ListCreateAPIView):
+    queryset = Sequence.objects.select_related('step').order_by('-updated')
     serializer_class = SequencesSerializer
+    lean_serializer_class = SequencesLeanSerializer
     pagination_class = ListPagination
-    filter_backends = [SequenceSearchFilter, SequenceOrderingFilter]
-    search_fields = ['title']
+    filter_backends = [FullTextSearchFilter, SequenceOrderingFilter]
+    search_vector = 'step__search'
+    search_trigram_fields = ['step__title']
     ordering_fields = ['title', 'updated', 'created', 'published']
 
     def post(self, request, format=None):
@@ -54,3 +114,13 @@ class SequenceListView(ListCreateAPIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class SequencePublishView(CreateAPIView):
+    def post(self, request, uuid):
+        sequence = Sequence.objects.select_related('step') \
+                                   .get(step__uuid=uuid)
+        published_sequence = sequence.publish()
+
+        serializer = PublishedSequenceSerializer(published_sequence)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,8 +1,8 @@
-from django.db.models import F, Max
+from django.db import transaction
 
 
 from rest_framework import status
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import (
     CreateAPIView,
     DestroyAPIView,
@@ -11,21 +11,41 @@ from rest_framework.generics import (
     RetrieveDestroyAPIView)
 from rest_framework.response import Response
 
+from core.lean import LeanListMixin
 from core.pagination import ListPagination
+from core.streaming import (
+    StreamingJSONResponse,
+    StreamingListMixin,
+    is_streaming)
 from api.base.choices import StepChoices
+from api.filters import FullTextSearchFilter
+from api.functions.conditional import tree_condition
 from api.models.step import Step, LinkedStep
 from api.serializers.step_serializers import (
     LinkStepSerializer,
+    LinkStepsSerializer,
+    OrderLinkedStepsSerializer,
     StepSerializer,
-    StepsSerializer)
+    StepsLeanSerializer,
+    StepsSerializer,
+    TreeDepthSerializer)
 
 
 class StepView(RetrieveDestroyAPIView):
     serializer_class = StepSerializer
 
+    @tree_condition
     def get(self, request, uuid):
+        params = TreeDepthSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
         step = Step.objects.get(uuid=uuid)
-        serializer = StepSerializer(step, context={'request': request})
+        context = {'request': request,
+                   'depth': params.validated_data.get('depth'),
+                   'stream': is_streaming(request)}
+        serializer = StepSerializer(step, context=context)
+        if context['stream']:
+            return StreamingJSONResponse(serializer.data)
         return Response(serializer.data)
 
     def patch(self, request, uuid):
@@ -45,13 +65,14 @@ class StepView(RetrieveDestroyAPIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class StepsView(ListCreateAPIView):
+class StepsView(StreamingListMixin, LeanListMixin, ListCreateAPIView):
     queryset = Step.objects.exclude(type=StepChoices.SEQUENCE) \
                            .order_by('-updated')
     serializer_class = StepsSerializer
+    lean_serializer_class = StepsLeanSerializer
     pagination_class = ListPagination
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ['title']
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
+    search_trigram_fields = ['title']
     ordering_fields = ['title', 'created', 'updated']
 
     def post(self, request):
@@ -63,21 +84,21 @@ class StepsView(ListCreateAPIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class StepLinkableListView(ListAPIView):
+class StepLinkableListView(StreamingListMixin, LeanListMixin, ListAPIView):
     serializer_class = StepsSerializer
+    lean_serializer_class = StepsLeanSerializer
     pagination_class = ListPagination
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ['title']
+    filter_backends = [FullTextSearchFilter, OrderingFilter]
+    search_trigram_fields = ['title']
     ordering_fields = ['title', 'created', 'updated']
 
     def get_queryset(self):
         super = Step.objects.get(uuid=self.kwargs['uuid'])
-        parent_pks = super.get_parent_pks()
-        linked = super.linked
-        children = [li.pk for li in linked]
-        excluded_pks = children + [super.pk] + parent_pks
+        children = LinkedStep.objects.filter(super=super).values('sub')
 
-        return Step.objects.exclude(pk__in=excluded_pks) \
+        return Step.objects.exclude(pk=super.pk) \
+                           .exclude(pk__in=children) \
+                           .exclude(pk__in=super.ancestors()) \
                            .exclude(type=StepChoices.SEQUENCE) \
                            .order_by('-updated')
 
@@ -85,55 +106,67 @@ class StepLinkableListView(ListAPIView):
 class LinkStepView(CreateAPIView):
     def post(self, request, uuid):
         context = {'uuid': uuid}
+        if 'subs' in request.data:
+            return self.post_many(request, context)
+
         serializer = LinkStepSerializer(data=request.data, context=context)
         if serializer.is_valid(raise_exception=True):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def post_many(self, request, context):
+        serializer = LinkStepsSerializer(data=request.data, context=context)
+        if serializer.is_valid(raise_exception=True):
+            linked_steps = serializer.save()
+            serializer = LinkStepSerializer(linked_steps, many=True)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class LinkedStepDeleteView(DestroyAPIView):
+    @transaction.atomic
     def delete(self, request, uuid):
         linked_step = LinkedStep.objects.get(super__uuid=uuid,
                                              sub__uuid=request.data['sub'])
-        max_pos = LinkedStep.objects.filter(super__uuid=uuid) \
-                                    .aggregate(Max('pos'))['pos__max']
-
-        LinkedStep.objects.filter(super__uuid=uuid) \
-                          .filter(pos__gt=linked_step.pos) \
-                          .filter(pos__lte=max_pos) \
-                          .update(pos=F('pos') - 1)
-
         linked_step.delete()
 
-        if max_pos == 0:
-            Step.objects.filter(uuid=uuid).update(type=StepChoices.STEP)
+        if not LinkedStep.objects.filter(super__uuid=uuid).exists():
+            Step.objects.get(uuid=uuid).update_type(StepChoices.STEP)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class LinkedStepOrderView(ListAPIView):
+    @transaction.atomic
     def post(self, request, uuid):
-        from_index = request.data['from_index']
-        to_index = request.data['to_index']
-        linked_step = LinkedStep.objects.get(super__uuid=uuid, pos=from_index)
+        if 'order' in request.data:
+            return self.post_order(request, uuid)
 
-        if from_index < to_index:  # Move down
-            LinkedStep.objects.filter(super__uuid=uuid) \
-                .filter(pos__gt=from_index) \
-                .filter(pos__lte=to_index) \
-                .update(pos=F('pos') - 1)
+        from_index = int(request.data['from_index'])
+        to_index = int(request.data['to_index'])
+        linked_step = LinkedStep.objects.filter(super__uuid=uuid) \
+                                        .order_by('rank')[from_index]
 
-        if from_index > to_index:  # Move up
-            LinkedStep.objects.filter(super__uuid=uuid) \
-                .filter(pos__lt=from_index) \
-                .filter(pos__gte=to_index) \
-                .update(pos=F('pos') + 1)
-
-        linked_step.pos = to_index
-        linked_step.save()
+        # Only the moved linked step gets a new rank
+        linked_step.move(to_index)
 
         return Response(status=status.HTTP_200_OK)
 
+    def post_order(self, request, uuid):
+        context = {'uuid': uuid}
+        serializer = OrderLinkedStepsSerializer(data=request.data,
+                                                context=context)
+        if serializer.is_valid(raise_exception=True):
+            serializer.save()
+            return Response(status=status.HTTP_200_OK)
+
+
+class StepUsageView(StreamingListMixin, LeanListMixin, ListAPIView):
+    serializer_class = StepsSerializer
+    lean_serializer_class = StepsLeanSerializer
+    pagination_class = ListPagination
+
+    def get_queryset(self):
+        step = Step.objects.get(uuid=self.kwargs['uuid'])
+        supers = LinkedStep.graph().parents(step.pk)
 
-class StepUsageView(ListAPIView):
-    pass
+        return Step.objects.filter(pk__in=supers).order_by('-updated')
@@ -0,0 +1,45 @@
+"""
+Benchmarks run against a throwaway test database created from the configured
+database settings, e.g. ``python -m benchmarks.step_ancestors``.
+"""
+import os
+from contextlib import contextmanager
+from time import perf_counter
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sequenceapi.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+
+@contextmanager
+def test_database():
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat=5):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+
+    return len(queries), min(timings) * 1000
+
+
+def report(title, rows):
+    print(title)
+    print(f'{"case":>24} {"queries":>8} {"ms":>10}')
+    for case, queries, ms in rows:
+        print(f'{case:>24} {queries:>8} {ms:>10.2f}')
@@ -0,0 +1,38 @@
+from benchmarks import measure, report, test_database
+
+from api.base.choices import StepChoices
+from api.models.sequence import Sequence
+from api.models.step import LinkedStep, Step
+
+
+def make_sequence(width, depth):
+    """
+    Builds a sequence where every step has ``width`` linked steps, down to
+    ``depth`` levels.
+    """
+    step = Step.objects.create(type=StepChoices.SEQUENCE, title='Sequence')
+    supers = [step]
+    for level in range(depth):
+        subs = []
+        for super in supers:
+            steps = Step.objects.bulk_create(
+                Step(title=f'Step {level}.{i}') for i in range(width))
+            LinkedStep.bulk_link(super, steps)
+            subs.extend(steps)
+        supers = subs
+    return Sequence.objects.create(step=step)
+
+
+def main():
+    rows = []
+    for width, depth in [(10, 2), (10, 3), (70, 2)]:
+        sequence = make_sequence(width, depth)
+        steps = sum(width ** level for level in range(1, depth + 1))
+        queries, ms = measure(sequence.publish)
+        rows.append((f'{steps} steps', queries, ms))
+    report('Sequence.publish()', rows)
+
+
+if __name__ == '__main__':
+    with test_database():
+        main()
@@ -0,0 +1,35 @@
+from benchmarks import measure, report, test_database
+from benchmarks.publish_sequence import make_sequence
+
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.functions.custom_renderers import (
+    MessagePackRenderer,
+    ORJSONRenderer,
+    msgpack)
+from api.serializers.sequence_serializers import SequenceSerializer
+
+
+@override_settings(STEP_TREE_MAX_NODES=20000)
+def main():
+    sequence = make_sequence(100, 2)
+    context = {'request': APIRequestFactory().get('/')}
+    data = SequenceSerializer(sequence, context=context).data
+
+    renderers = [('json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+    if msgpack is not None:
+        renderers.append(('msgpack', MessagePackRenderer()))
+
+    rows = []
+    for case, renderer in renderers:
+        size = len(renderer.render(data))
+        queries, ms = measure(lambda: renderer.render(data))
+        rows.append((f'{case}, {size // 1024} KiB', queries, ms))
+    report('Rendering a tree of 10100 steps', rows)
+
+
+if __name__ == '__main__':
+    with test_database():
+        main()
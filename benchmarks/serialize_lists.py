@@ -0,0 +1,49 @@
+from benchmarks import measure, report, test_database
+
+from rest_framework.test import APIRequestFactory
+
+from api.base.choices import StepChoices
+from api.models.sequence import Sequence
+from api.models.step import Step
+from api.serializers.sequence_serializers import (
+    SequencesLeanSerializer,
+    SequencesSerializer)
+from api.serializers.step_serializers import (
+    StepsLeanSerializer,
+    StepsSerializer)
+
+
+def make_rows(count):
+    Step.objects.bulk_create(Step(title=f'Step {i}') for i in range(count))
+    for i in range(count):
+        step = Step.objects.create(type=StepChoices.SEQUENCE,
+                                   title=f'Sequence {i}')
+        Sequence.objects.create(step=step)
+
+
+def main():
+    make_rows(100)
+    context = {'request': APIRequestFactory().get('/')}
+    steps = Step.objects.exclude(type=StepChoices.SEQUENCE)[:100]
+    sequences = Sequence.objects.select_related('step')[:100]
+
+    cases = [
+        ('steps, model', lambda: StepsSerializer(
+            steps.all(), many=True, context=context).data),
+        ('steps, lean', lambda: StepsLeanSerializer(context).many(
+            steps.values(*StepsLeanSerializer.fields))),
+        ('sequences, model', lambda: SequencesSerializer(
+            sequences.all(), many=True, context=context).data),
+        ('sequences, lean', lambda: SequencesLeanSerializer(context).many(
+            sequences.values(*SequencesLeanSerializer.fields))),
+    ]
+    rows = []
+    for case, func in cases:
+        queries, ms = measure(func)
+        rows.append((case, queries, ms))
+    report('Serializing 100 rows', rows)
+
+
+if __name__ == '__main__':
+    with test_database():
+        main()
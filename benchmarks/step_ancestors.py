@@ -0,0 +1,36 @@
+from benchmarks import measure, report, test_database
+
+from api.models.step import LinkedStep, Step
+
+
+def make_fan_in(levels, fan_in):
+    """
+    Builds a DAG where every step is linked below ``fan_in`` new super steps,
+    so the bottom step ends up with thousands of ancestors.
+    """
+    bottom = Step.objects.create()
+    subs = [bottom]
+    for _ in range(levels):
+        supers = []
+        for sub in subs:
+            for _ in range(fan_in):
+                super = Step.objects.create()
+                LinkedStep.objects.create(super=super, sub=sub)
+                supers.append(super)
+        subs = supers
+    return bottom
+
+
+def main():
+    rows = []
+    for levels in [4, 8, 11]:
+        bottom = make_fan_in(levels, 2)
+        ancestors = bottom.ancestors().count()
+        queries, ms = measure(lambda: list(bottom.ancestors()))
+        rows.append((f'{ancestors} ancestors', queries, ms))
+    report('Step.ancestors()', rows)
+
+
+if __name__ == '__main__':
+    with test_database():
+        main()
@@ -1,13 +1,38 @@
+import base64
+import binascii
+import hashlib
+import json
 from math import ceil
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import EmptyPage
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from django.db.models.query import ValuesIterable
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ListPagination(PageNumberPagination):
+    """
+    Page number pagination, or keyset pagination when the list is requested
+    with a cursor parameter, which is left empty for the first page.
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+
         page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
         return Response({
             'next_url': self.get_next_link(),
@@ -31,3 +56,145 @@ class ListPagination(PageNumberPagination):
             return self.page.next_page_number()
         except EmptyPage:
             return None
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages through a list ordered by a single field, with the primary key
+    as tiebreaker, by filtering on the last row seen instead of counting
+    and skipping rows, so every page costs the same. Cursors encode the
+    position and direction. Totals are only computed on request, either
+    exactly and cached (count=true) or estimated by the planner
+    (count=estimate).
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        self.field, descending = self.get_ordering(queryset)
+        self.count = self.get_count(queryset)
+        if queryset._iterable_class is ValuesIterable:
+            # Rows read as values need the position in them
+            missing = [name for name in dict.fromkeys([self.field, 'pk'])
+                       if name not in queryset.query.values_select]
+            queryset = queryset.values(*queryset.query.values_select,
+                                       *queryset.query.annotation_select,
+                                       *missing)
+
+        position = self.decode_cursor(request)
+        reverse = position is not None and position['reverse']
+        # Paging backwards reads the rows before the position in reverse
+        descending = descending != reverse
+        queryset = queryset.order_by(*self.order(descending))
+        if position is not None:
+            queryset = queryset.filter(self.after(descending,
+                                                  position['value'],
+                                                  position['pk']))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next = self.encode_cursor(rows[-1], False) \
+            if has_next and rows else None
+        self.previous = self.encode_cursor(rows[0], True) \
+            if has_previous and rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next_url': self.get_link(self.next),
+            'previous_url': self.get_link(self.previous),
+            'next': self.next,
+            'previous': self.previous,
+            'count': self.count,
+            'results': data
+        })
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by
+                    if isinstance(field, str)]
+        if not ordering:
+            return 'pk', True
+        return ordering[0].lstrip('-'), ordering[0].startswith('-')
+
+    def order(self, descending):
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.field}', f'{prefix}pk']
+
+    def after(self, descending, value, pk):
+        """
+        Returns the filter for the rows following the position in the given
+        order, in which rows without a value sort last ascending and first
+        descending. The redundant bound on the field lets the database use
+        an index on it for the range.
+        """
+        lookup = 'lt' if descending else 'gt'
+        is_null = Q(**{f'{self.field}__isnull': True})
+        following_pk = Q(**{f'pk__{lookup}': pk})
+        if value is None:
+            following = is_null & following_pk
+            return following | ~is_null if descending else following
+
+        following = Q(**{f'{self.field}__{lookup}e': value}) & \
+            (Q(**{f'{self.field}__{lookup}': value}) | following_pk)
+        return following if descending else following | is_null
+
+    def get_count(self, queryset):
+        mode = self.request.query_params.get(self.count_query_param)
+        if mode == 'estimate':
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            return plan[0]['Plan']['Plan Rows']
+        if mode in ['1', 'true']:
+            query = str(queryset.order_by().query).encode()
+            key = f'list-count:{hashlib.sha256(query).hexdigest()}'
+            return cache.get_or_set(key, queryset.count,
+                                    timeout=settings.LIST_COUNT_CACHE_TIMEOUT)
+        return None
+
+    def encode_cursor(self, row, reverse):
+        if isinstance(row, dict):
+            value, pk = row[self.field], row['pk']
+        else:
+            value, pk = row, row.pk
+            for name in self.field.split('__'):
+                value = getattr(value, name) if value is not None else None
+        position = {'field': self.field,
+                    'value': value,
+                    'pk': pk,
+                    'reverse': reverse}
+        # str keeps the microseconds of datetimes
+        data = json.dumps(position, default=str).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            position = json.loads(data)
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # A cursor only applies to the ordering it was created for
+        if not isinstance(position, dict) or \
+                position.get('field') != self.field or \
+                not {'value', 'pk', 'reverse'} <= position.keys():
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -0,0 +1,80 @@
+from types import GeneratorType
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+CHUNK_SIZE = 8192
+
+
+def is_streaming(request):
+    return request.query_params.get('stream') in ['1', 'true']
+
+
+def iter_json(value, encoder):
+    """
+    Yields the JSON for value piece by piece. Generators are written as
+    arrays while they are consumed, so nested generators never have to be
+    held in memory as a whole.
+    """
+    if isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield f'{"," if i else ""}{encoder.encode(str(key))}:'
+            yield from iter_json(item, encoder)
+        yield '}'
+    elif isinstance(value, (list, tuple, GeneratorType)):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ','
+            yield from iter_json(item, encoder)
+        yield ']'
+    else:
+        yield encoder.encode(value)
+
+
+def join_chunks(pieces, size=CHUNK_SIZE):
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk).encode()
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk).encode()
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        super().__init__(join_chunks(iter_json(data, encoder)), **kwargs)
+
+
+class StreamingListMixin:
+    """
+    Streams the whole filtered queryset as a JSON array, instead of a single
+    page, when the list is requested with ?stream=true.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not is_streaming(request):
+            return super().list(request, *args, **kwargs)
+
+        if getattr(self, 'lean_serializer_class', None) is not None:
+            serializer = self.get_lean_serializer()
+            queryset = self.get_lean_queryset(serializer)
+            return StreamingJSONResponse(
+                serializer.to_representation(row)
+                for row in queryset.iterator())
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        return StreamingJSONResponse(
+            serializer_class(instance, context=context).data
+            for instance in queryset.iterator())
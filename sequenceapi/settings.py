@@ -1,4 +1,6 @@
 import os
+import tempfile
+from importlib.util import find_spec
 
 from dotenv import load_dotenv
 from pathlib import Path
@@ -22,6 +24,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third party
     'storages',
@@ -38,8 +41,28 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.functions.custom_renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# MessagePack is offered through content negotiation where msgpack is
+# installed
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'api.functions.custom_renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append(
+        'api.functions.custom_parsers.MessagePackParser')
+
+# Totals of lists paged with a cursor are counted on request and cached
+LIST_COUNT_CACHE_TIMEOUT = 60
+
 # Use nose to run all tests
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
@@ -108,6 +131,14 @@ LOGGING = {
     },
 }
 
+# Step graph shared by all workers on a node, see api.functions.step_graph
+STEP_GRAPH_PATH = os.getenv(
+    'STEP_GRAPH_PATH',
+    os.path.join(tempfile.gettempdir(), 'sequenceapi-step-graph'))
+
+# Step trees are cut off at the last level that fits within this many nodes
+STEP_TREE_MAX_NODES = int(os.getenv('STEP_TREE_MAX_NODES', 10000))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -155,6 +186,38 @@ AWS_STORAGE_BUCKET_NAME = 'tiverspace'
 AWS_S3_ACCESS_KEY_ID = os.environ.get('AWS_S3_ACCESS_KEY_ID')
 AWS_S3_SECRET_ACCESS_KEY = os.getenv('AWS_S3_SECRET_ACCESS_KEY')
 AWS_S3_ENDPOINT_URL = 'https://fra1.digitaloceanspaces.com'
+AWS_QUERYSTRING_EXPIRE = 3600
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_S3_MAX_POOL_CONNECTIONS', 20))
+
+# Deleted files are removed from storage in batches by a background thread,
+# see api.functions.storage_deletion
+STORAGE_DELETE_BATCH_SIZE = 1000
+STORAGE_DELETE_BATCH_WAIT = 0.5
+STORAGE_DELETE_RETRIES = 5
+STORAGE_DELETE_BACKOFF = 0.5
+
+# Signed image urls are reused until well before they expire
+IMAGE_URL_CACHE_TIMEOUT = AWS_QUERYSTRING_EXPIRE // 2
+
+# Resized copies of uploaded images, generated in the background
+IMAGE_VARIANT_WIDTHS = {'thumbnail': 160, 'medium': 640, 'large': 1280}
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+# Images are uploaded straight to the bucket with presigned requests, files
+# larger than a part are uploaded in parts of that size
+IMAGE_UPLOAD_EXPIRE = 60 * 15
+IMAGE_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+IMAGE_UPLOAD_PART_SIZE = 8 * 1024 * 1024
+# Uploads are finalized with the token they were started with, within this
+# time. Multipart uploads left unfinished for longer are aborted by the
+# abort_image_uploads command.
+IMAGE_UPLOAD_FINALIZE_EXPIRE = 60 * 60
+
+# Images are either streamed from storage by the workers or, in "redirect"
+# mode, answered with a redirect to IMAGE_CDN_URL or a signed storage url
+IMAGE_RENDER_MODE = os.getenv('IMAGE_RENDER_MODE', 'stream')
+IMAGE_CDN_URL = os.getenv('IMAGE_CDN_URL')
+IMAGE_MAX_AGE = 60 * 60 * 24
 
 STATICFILES_LOCATION = 'sequence/api/static'
 STATICFILES_STORAGE = 'sequenceapi.storages.StaticRootS3Boto3Storage'
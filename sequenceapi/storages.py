@@ -1,9 +1,91 @@
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 
 
-class StaticRootS3Boto3Storage(S3Boto3Storage):
+_lock = threading.Lock()
+_session = None
+_client = None
+_resource_class = None
+
+
+def s3_session():
+    """
+    Returns the process wide boto3 session, so credentials are only
+    resolved once.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session(
+                aws_access_key_id=settings.AWS_S3_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_S3_SECRET_ACCESS_KEY)
+        return _session
+
+
+def s3_client():
+    """
+    Returns the process wide S3 client. Clients are thread safe and keep a
+    pool of connections, which all threads share.
+    """
+    global _client
+    session = s3_session()
+    with _lock:
+        if _client is None:
+            _client = session.client(
+                's3',
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                config=Config(
+                    max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                    retries={'mode': 'standard'}))
+        return _client
+
+
+def s3_resource():
+    """
+    Returns a new S3 resource sending its requests through the shared
+    client. Resources are not thread safe, every thread needs its own.
+    """
+    global _resource_class
+    client = s3_client()
+    session = s3_session()
+    with _lock:
+        if _resource_class is None:
+            # Sessions are not thread safe either, so the resource class is
+            # generated from the service model once, under the lock
+            _resource_class = type(session.resource(
+                's3', endpoint_url=settings.AWS_S3_ENDPOINT_URL))
+    return _resource_class(client=client)
+
+
+def storage_key(storage, name):
+    """
+    Returns the bucket key of a file name in an S3 storage.
+    """
+    return storage._normalize_name(storage._clean_name(name))
+
+
+class SharedClientS3Boto3Storage(S3Boto3Storage):
+    """
+    Resources are not thread safe and stay per thread, but they all send
+    their requests through the shared client and its connection pool.
+    """
+
+    @property
+    def connection(self):
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            connection = s3_resource()
+            self._connections.connection = connection
+        return connection
+
+
+class StaticRootS3Boto3Storage(SharedClientS3Boto3Storage):
     location = 'sequence/api/static'
 
 
-class MediaRootS3Boto3Storage(S3Boto3Storage):
+class MediaRootS3Boto3Storage(SharedClientS3Boto3Storage):
     location = 'sequence/api/media'